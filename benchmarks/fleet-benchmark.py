@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Load-test the registration server with a synthetic client fleet
+
+Starts the server under gunicorn (with a local Prometheus stub) once per
+fleet size, then has every synthetic client register and push samples and
+scrapes /metrics repeatedly. Reports throughput, p50/p99 latency and the
+server's memory per endpoint and fleet size.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from prometheus_stub import PrometheusStub
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server-docker')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, prometheus_url, workdir, workers):
+    """Run the server under gunicorn with its config, state and logs kept in workdir"""
+    env = dict(
+        os.environ,
+        PROMETHEUS_CONFIG=os.path.join(workdir, 'central-prometheus.yml'),
+        PROMETHEUS_URL=prometheus_url,
+        STATE_DIR=os.path.join(workdir, 'state'),
+        STATE_SOCKET=os.path.join(workdir, 'state.sock'),
+        WEB_CONCURRENCY=str(workers),
+        LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'),
+    )
+    log_file = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', 'registration-server:app'],
+        cwd=SERVER_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}, see {log_file.name}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/status', timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not come up, see {log_file.name}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def process_tree_rss(pid):
+    """Resident memory of pid and all its descendants in bytes (Linux /proc), or None"""
+    children = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # Fields after the parenthesised command name: state, ppid, ...
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return None
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+class SyntheticClient:
+    """One fake push client: a hostname, an address and a random walk of metrics"""
+
+    def __init__(self, index, extra_metrics=0):
+        self.hostname = f'bench-{index:05d}'
+        # Loopback addresses refuse the server's reachability probes right away
+        self.ip = f'127.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255 or 1}'
+        self.client_id = f'{self.hostname}_{self.ip}'
+        self.extra_metrics = extra_metrics
+        self._random = random.Random(index)
+
+    def registration(self):
+        return {'hostname': self.hostname, 'ip': self.ip, 'port': 9}
+
+    def sample(self, timestamp):
+        walk = self._random.uniform
+        metrics = {
+            'cpu_usage': walk(0, 100),
+            'memory_usage': walk(0, 100),
+            'disk_usage': walk(0, 100),
+            'load_average{period="1m"}': walk(0, 8),
+            'network_receive_bytes_total{device="eth0"}': walk(0, 1e9),
+        }
+        for i in range(self.extra_metrics):
+            metrics[f'bench_metric_{i}'] = walk(0, 1000)
+        return {'client_id': self.client_id, 'hostname': self.hostname, 'timestamp': timestamp, 'metrics': metrics}
+
+
+def run_requests(send, items, concurrency):
+    """Call send(session, item) for every item from concurrency threads; per-request latencies and failures"""
+    local = threading.local()
+
+    def timed(item):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            ok = send(local.session, item).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, items))
+    return results, time.perf_counter() - started
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(results, elapsed, rss):
+    latencies = [latency for latency, _ in results]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'throughput_rps': round(len(results) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else None,
+        'rss_mb': round(rss / 2 ** 20, 1) if rss is not None else None,
+    }
+
+
+def benchmark_fleet(size, args, stub):
+    """Start a fresh server and put one fleet of the given size through register, push and scrape"""
+    clients = [SyntheticClient(i, args.extra_metrics) for i in range(size)]
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    stub.sd_url = f'{base}/sd/targets'
+    with tempfile.TemporaryDirectory(prefix='fleet-benchmark-') as workdir:
+        server = start_server(port, stub.url, workdir, args.workers)
+        try:
+            report = {'fleet_size': size, 'idle_rss_mb': None, 'endpoints': {}}
+            rss = process_tree_rss(server.pid)
+            report['idle_rss_mb'] = round(rss / 2 ** 20, 1) if rss is not None else None
+
+            results, elapsed = run_requests(
+                lambda session, client: session.post(f'{base}/register', json=client.registration(), timeout=30),
+                clients, args.concurrency)
+            report['endpoints']['POST /register'] = summarize(results, elapsed, process_tree_rss(server.pid))
+
+            now = int(time.time())
+            pushes = [(client, now + round_ * 15) for round_ in range(args.rounds) for client in clients]
+            results, elapsed = run_requests(
+                lambda session, push: session.post(f'{base}/metrics', json=push[0].sample(push[1]), timeout=30),
+                pushes, args.concurrency)
+            report['endpoints']['POST /metrics'] = summarize(results, elapsed, process_tree_rss(server.pid))
+
+            # Prometheus-style scrapes: gzip, and never a conditional request
+            results, elapsed = run_requests(
+                lambda session, _: session.get(f'{base}/metrics', headers={'Accept-Encoding': 'gzip'}, timeout=60),
+                range(args.scrapes), args.scrape_concurrency)
+            report['endpoints']['GET /metrics'] = summarize(results, elapsed, process_tree_rss(server.pid))
+            return report
+        finally:
+            stop_server(server)
+
+
+def print_report(reports):
+    print(f"{'fleet':>7}  {'endpoint':<15} {'requests':>9} {'errors':>7} {'req/s':>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'rss MB':>8}")
+    print('-' * 92)
+    for report in reports:
+        for endpoint, stats in report['endpoints'].items():
+            print(f"{report['fleet_size']:>7}  {endpoint:<15} {stats['requests']:>9} {stats['errors']:>7} "
+                  f"{stats['throughput_rps']:>9} {stats['p50_ms']:>8} {stats['p99_ms']:>8} "
+                  f"{stats['max_ms']:>8} {stats['rss_mb']!s:>8}")
+
+
+def compare(reports, baseline_path, threshold):
+    """Print endpoints whose p99 or throughput got worse than the baseline by more than threshold"""
+    with open(baseline_path) as f:
+        baseline = {report['fleet_size']: report for report in json.load(f)['fleets']}
+    regressions = []
+    for report in reports:
+        previous = baseline.get(report['fleet_size'])
+        if previous is None:
+            continue
+        for endpoint, stats in report['endpoints'].items():
+            before = previous['endpoints'].get(endpoint)
+            if not before:
+                continue
+            if before['p99_ms'] and stats['p99_ms'] > before['p99_ms'] * (1 + threshold):
+                regressions.append(f"{report['fleet_size']} {endpoint}: p99 {before['p99_ms']} -> {stats['p99_ms']} ms")
+            if before['throughput_rps'] and stats['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+                regressions.append(f"{report['fleet_size']} {endpoint}: "
+                                   f"{before['throughput_rps']} -> {stats['throughput_rps']} req/s")
+    for regression in regressions:
+        print(f"⚠️ Regression: {regression}")
+    if not regressions:
+        print("✅ No regressions against the baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the registration server with a synthetic client fleet")
+    parser.add_argument('--sizes', default='100,1000,5000', help="comma-separated fleet sizes, run in order")
+    parser.add_argument('--rounds', type=int, default=3, help="pushes per client")
+    parser.add_argument('--extra-metrics', type=int, default=20, help="metrics per sample beyond the basic five")
+    parser.add_argument('--scrapes', type=int, default=50, help="GET /metrics requests per fleet size")
+    parser.add_argument('--concurrency', type=int, default=64, help="concurrent registering/pushing clients")
+    parser.add_argument('--scrape-concurrency', type=int, default=2, help="concurrent scrapers")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    parser.add_argument('--baseline', help="earlier --output report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    started_at = int(time.time())
+    stub = PrometheusStub().start()
+    reports = []
+    try:
+        for size in (int(size) for size in args.sizes.split(',') if size.strip()):
+            print(f"🚀 Benchmarking a fleet of {size} clients...", file=sys.stderr)
+            reports.append(benchmark_fleet(size, args, stub))
+    finally:
+        stub.stop()
+
+    print_report(reports)
+    result = {
+        'started_at': started_at,
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'prometheus_stub': {'reloads': stub.reloads, 'target_queries': stub.target_queries},
+        'fleets': reports,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline and compare(reports, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
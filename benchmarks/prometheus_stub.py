@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Stand-in for Prometheus' lifecycle and targets API, for benchmarking the server offline"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class PrometheusStub:
+    """Answers POST /-/reload and GET /api/v1/targets on a local port
+
+    Targets are read from the registration server's /sd/targets (as the real
+    Prometheus would via http_sd) and all reported healthy. Reloads and
+    target queries are counted so a benchmark can report them.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, sd_url=None):
+        self.sd_url = sd_url
+        self.reloads = 0
+        self.target_queries = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != '/-/reload':
+                    return self._reply(404, {'status': 'error', 'error': 'not found'})
+                with stub._lock:
+                    stub.reloads += 1
+                self._reply(200, None)
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/api/v1/targets':
+                    return self._reply(404, {'status': 'error', 'error': 'not found'})
+                with stub._lock:
+                    stub.target_queries += 1
+                self._reply(200, {'status': 'success', 'data': {'activeTargets': stub.active_targets()}})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def active_targets(self):
+        if not self.sd_url:
+            return []
+        try:
+            groups = requests.get(self.sd_url, timeout=5).json()
+        except Exception:
+            return []
+        return [
+            {'labels': {'job': 'clients', 'instance': target, **group.get('labels', {})}, 'health': 'up'}
+            for group in groups for target in group.get('targets', [])
+        ]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='prometheus-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the Prometheus stub on its own")
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--sd-url', default='http://localhost:5001/sd/targets')
+    args = parser.parse_args()
+    stub = PrometheusStub(host='0.0.0.0', port=args.port, sd_url=args.sd_url)
+    print(f"🧪 Prometheus stub listening on port {args.port}")
+    stub._server.serve_forever()
@@ -2,197 +2,151 @@
 import requests
 import socket
 import json
+import logging
 import time
 import os
 from prometheus_client import start_http_server, Gauge
-import psutil
-import mysql.connector
+from collectors import collector_name, enabled_collectors, metric_family, split_key
+from public_ip import PublicIP
+from log_config import setup_logging
+from scheduler import CollectionScheduler
+from sharding import ShardRouter, parse_shards
+
+# Logging goes through a queue to a writer thread, so collection never waits on stdout
+setup_logging('auto-discovery-client')
+log = logging.getLogger('auto-discovery-client')
 
 # Metrics
-CPU_USAGE = Gauge('host_cpu_usage', 'CPU usage %', ['hostname', 'client_id'])
-MEMORY_USAGE = Gauge('host_memory_usage', 'Memory usage %', ['hostname', 'client_id'])
-DISK_USAGE = Gauge('host_disk_usage', 'Disk usage %', ['hostname', 'client_id'])
-DB_CONNECTIONS = Gauge('mysql_active_connections', 'Active MySQL connections', ['hostname', 'client_id'])
-VIDEOS_PROCESSED = Gauge('videos_processed_total', 'Total videos processed', ['hostname', 'client_id'])
+COLLECT_DURATION = Gauge('collector_duration_seconds', 'Seconds the last run of each collector took', ['hostname', 'client_id', 'collector'])
 
-def get_public_ip():
-    """Get the public IP address"""
-    try:
-        # Try multiple services to get public IP
-        services = [
-            'https://ifconfig.me/ip',
-            'https://api.ipify.org',
-            'https://ipecho.net/plain',
-            'https://icanhazip.com'
-        ]
-        
-        for service in services:
-            try:
-                response = requests.get(service, timeout=10)
-                if response.status_code == 200:
-                    public_ip = response.text.strip()
-                    print(f"✅ Detected public IP: {public_ip}")
-                    return public_ip
-            except Exception as e:
-                print(f"⚠️ Failed to get IP from {service}: {e}")
-                continue
-        
-        # Fallback to local IP if public IP detection fails
-        print("⚠️ Could not detect public IP, using local IP")
-        return get_local_ip()
-    except Exception as e:
-        print(f"❌ Error getting public IP: {e}")
-        return get_local_ip()
+# Gauges by family, created on first sight under the names and help the server gives pushed samples
+GAUGES = {}
+# Label sets set on each gauge last tick, so series that disappear (e.g. a finished process) are removed
+exported_labels = {}
 
-def get_local_ip():
-    """Get the local IP address (fallback)"""
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except:
-        return socket.gethostbyname(socket.gethostname())
+# Central server; with CENTRAL_SHARDS (comma-separated server URLs) the client registers with its shard instead
+CENTRAL_HOST = os.getenv('CENTRAL_HOST', 'https://monitoring.takeleap.in')
+CENTRAL_SHARDS = parse_shards(os.getenv('CENTRAL_SHARDS', ''))
+router = ShardRouter(CENTRAL_HOST, CENTRAL_SHARDS)
 
-def register_with_central(central_host, max_retries=3):
-    """Register this client with central monitoring"""
+# Resolved once at startup and refreshed in the background, so cycles never wait on it
+public_ip = PublicIP()
+
+# Collectors run concurrently on fixed COLLECT_INTERVAL ticks, each bounded by COLLECT_TIMEOUT
+COLLECT_INTERVAL = float(os.getenv('COLLECT_INTERVAL', '15'))
+COLLECT_TIMEOUT = float(os.getenv('COLLECT_TIMEOUT', '10'))
+scheduler = CollectionScheduler(COLLECT_INTERVAL, COLLECT_TIMEOUT)
+
+def register_with_central(max_retries=3):
+    """Register this client with central monitoring (its shard in shard mode)"""
     hostname = socket.gethostname()
-    public_ip = get_public_ip()
     
     # Get port from environment variable
     port = int(os.getenv('METRICS_PORT', 8118))
     
     client_info = {
         "hostname": hostname,
-        "ip": public_ip,
+        "ip": public_ip.get(),
         "port": port,
         "metrics_path": "/metrics"
     }
     
+    client_id = f"{hostname}-{client_info['ip']}"
     for attempt in range(max_retries):
         try:
-            # Use the CENTRAL_HOST environment variable directly
+            central_host = router.host_for(client_id)
             response = requests.post(f"{central_host}/register", 
                                    json=client_info, timeout=10)
             if response.status_code == 200:
                 result = response.json()
-                print(f"✅ Registration successful: {result.get('message', 'OK')}")
+                log.info("✅ Registration successful", extra={'result': result.get('message', 'OK'), 'central_host': central_host})
                 return True
+            elif response.status_code == 421:
+                # Our shard list is out of date; the next attempt goes where the server says
+                router.redirect(client_id, response.json().get('shard'))
+                continue
             else:
-                print(f"❌ Registration failed (attempt {attempt + 1}): {response.status_code} - {response.text}")
+                log.error("❌ Registration failed", extra={'attempt': attempt + 1, 'status': response.status_code, 'response': response.text[:500]})
         except Exception as e:
-            print(f"❌ Registration error (attempt {attempt + 1}): {e}")
+            log.error("❌ Registration error", extra={'attempt': attempt + 1, 'error': str(e)})
         
         if attempt < max_retries - 1:
             time.sleep(5)  # Wait before retry
     
-    print(f"❌ Failed to register after {max_retries} attempts")
+    log.error("❌ Failed to register", extra={'attempts': max_retries})
     return False
 
+for collector in enabled_collectors():
+    scheduler.add(collector_name(collector), collector.collect, collector.timeout)
+
+def export_metrics(hostname, client_id, metrics):
+    """Set a gauge per collected metric, creating gauges for new families as they appear"""
+    current = {}
+    for key, value in metrics.items():
+        name, labels = split_key(key)
+        name, help_text = metric_family(name)
+        gauge = GAUGES.get(name)
+        if gauge is None:
+            gauge = GAUGES[name] = Gauge(name, help_text, ['hostname', 'client_id', *sorted(labels)])
+        label_values = (hostname, client_id, *(labels[label] for label in sorted(labels)))
+        try:
+            gauge.labels(*label_values).set(value)
+        except ValueError as e:
+            log.warning("⚠️ Skipping metric", extra={'key': key, 'error': str(e)})
+            continue
+        current.setdefault(name, set()).add(label_values)
+    
+    for name, label_sets in exported_labels.items():
+        for label_values in label_sets - current.get(name, set()):
+            GAUGES[name].remove(*label_values)
+    exported_labels.clear()
+    exported_labels.update(current)
+
 def collect_metrics():
-    """Collect system metrics"""
+    """Run the enabled collectors concurrently and export their metrics"""
     hostname = socket.gethostname()
-    client_id = f"{hostname}-{get_public_ip()}"
-    
-    # CPU
-    cpu_percent = psutil.cpu_percent(interval=1)
-    CPU_USAGE.labels(hostname, client_id).set(cpu_percent)
-    
-    # Memory
-    memory = psutil.virtual_memory()
-    MEMORY_USAGE.labels(hostname, client_id).set(memory.percent)
+    client_id = f"{hostname}-{public_ip.get()}"
     
-    # Disk
-    disk = psutil.disk_usage('/')
-    disk_percent = (disk.used / disk.total) * 100
-    DISK_USAGE.labels(hostname, client_id).set(disk_percent)
+    metrics = scheduler.collect()
+    export_metrics(hostname, client_id, metrics)
+    for name, seconds in scheduler.durations().items():
+        COLLECT_DURATION.labels(hostname, client_id, name).set(seconds)
     
-    # Database metrics
-    db_connections, videos_processed = get_db_metrics()
-    DB_CONNECTIONS.labels(hostname, client_id).set(db_connections)
-    VIDEOS_PROCESSED.labels(hostname, client_id).set(videos_processed)
-    
-    print(f"Metrics: CPU={cpu_percent}%, Memory={memory.percent}%, Disk={disk_percent:.1f}%, DB_Conn={db_connections}, Videos={videos_processed}")
-
-def get_db_metrics():
-    """Get MySQL database metrics"""
-    try:
-        # Database connection parameters from environment
-        db_host = os.getenv('DB_HOST', 'localhost')
-        db_user = os.getenv('DB_USER', 'root')
-        db_password = os.getenv('DB_PASSWORD', 'password')
-        db_name = os.getenv('DB_NAME', 'take_leap')
-        db_port = int(os.getenv('DB_PORT', '3306'))
-        
-        conn = mysql.connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name,
-            port=db_port,
-            connect_timeout=5
-        )
-        cursor = conn.cursor()
-        
-        # Get active connections
-        cursor.execute("SHOW STATUS LIKE 'Threads_connected'")
-        connections = int(cursor.fetchone()[1])
-        
-        # Get processed videos count - try multiple table names
-        try:
-            cursor.execute("SELECT COUNT(*) FROM video_uploads WHERE is_processed = 1 AND progress_value = 100")
-            videos_processed = cursor.fetchone()[0]
-        except mysql.connector.Error:
-            # Fallback to different table structure
-            try:
-                cursor.execute("SELECT COUNT(*) FROM uploads WHERE status = 'completed'")
-                videos_processed = cursor.fetchone()[0]
-            except mysql.connector.Error:
-                videos_processed = 0
-        
-        cursor.close()
-        conn.close()
-        
-        return connections, videos_processed
-        
-    except Exception as e:
-        print(f"Database error: {e}")
-        return 0, 0
+    log.info("Metrics collected", extra={
+        'cpu': metrics.get('cpu_usage'), 'memory': metrics.get('memory_usage'),
+        'disk': round(metrics.get('disk_usage', 0), 1), 'db_connections': metrics.get('mysql_connections'),
+        'videos': metrics.get('videos_processed')
+    })
 
 if __name__ == '__main__':
     hostname = socket.gethostname()
-    central_host = os.getenv('CENTRAL_HOST', 'https://monitoring.takeleap.in')
     metrics_port = int(os.getenv('METRICS_PORT', 8118))
     
-    print(f"🚀 Starting client exporter: {hostname}")
-    print(f"🌐 Central monitoring: {central_host}")
-    print(f"📊 Metrics port: {metrics_port}")
-    print(f"🔍 Detecting public IP for registration...")
+    log.info("🚀 Starting client exporter", extra={
+        'hostname': hostname, 'central_host': router.host_for(f"{hostname}-{public_ip.get()}"),
+        'shards': len(CENTRAL_SHARDS) or None, 'metrics_port': metrics_port
+    })
     
     # Start metrics server on all interfaces (0.0.0.0) so it's accessible from outside container
-    print(f"🚀 Starting metrics server on port {metrics_port}...")
     start_http_server(metrics_port, addr='0.0.0.0')
-    print(f"✅ Metrics server started on port {metrics_port} (accessible from outside container)")
+    log.info("✅ Metrics server started (accessible from outside container)", extra={'metrics_port': metrics_port})
     
     # Register with central (with retry)
-    registration_success = register_with_central(central_host)
+    registration_success = register_with_central()
     
     # Re-register periodically in case server restarts
     last_registration = time.time()
     registration_interval = 300  # 5 minutes
     
-    # Collect metrics loop
-    while True:
-        try:
-            collect_metrics()
-            
-            # Re-register periodically
-            if time.time() - last_registration > registration_interval:
-                if register_with_central(central_host):
-                    last_registration = time.time()
-            
-            time.sleep(15)
-        except Exception as e:
-            print(f"Error: {e}")
-            time.sleep(5)
\ No newline at end of file
+    def register_if_due():
+        global last_registration
+        if register_with_central():
+            last_registration = time.time()
+    
+    def tick(_):
+        collect_metrics()
+        # Registration retries sleep between attempts, so they run off the collection path
+        if time.time() - last_registration > registration_interval:
+            scheduler.run_background('registration', register_if_due)
+    
+    scheduler.run_forever(tick)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+import importlib
+import logging
+import os
+import re
+import time
+
+import psutil
+
+from db_metrics import DBMetricsCollector
+
+log = logging.getLogger(__name__)
+
+# Collector classes by name; extra ones can be registered or given as 'module:Class' in COLLECTORS
+COLLECTORS = {}
+
+DEFAULT_COLLECTORS = 'system,mysql,cpu_cores,load,network,diskio,mounts'
+
+# Payload keys of the built-in metrics -> (exported family name, help); the server maps pushed
+# samples with the same table (KNOWN_METRICS in server-docker/exposition.py), so a host has the
+# same series names whether it is scraped or pushes
+METRIC_FAMILIES = {
+    'cpu_usage': ('host_cpu_usage', 'CPU usage percent'),
+    'memory_usage': ('host_memory_usage', 'Memory usage percent'),
+    'disk_usage': ('host_disk_usage', 'Root filesystem usage percent'),
+    'mysql_connections': ('mysql_active_connections', 'Active MySQL connections'),
+    'videos_processed': ('videos_processed_total', 'Videos fully processed'),
+    'videos_error': ('videos_error_total', 'Videos with an error message'),
+    'site_statics': ('site_statics_total', 'Videos with site statistics uploaded'),
+    'videos_not_processed': ('videos_not_processed_total', 'Videos not yet fully processed'),
+    'collector_duration_seconds': ('collector_duration_seconds', 'Seconds the last run of each collector took'),
+    'cpu_core_usage': ('host_cpu_core_usage', 'CPU usage percent per core'),
+    'cpu_count': ('host_cpu_count', 'Logical CPUs'),
+    'load1': ('host_load1', '1-minute load average'),
+    'load5': ('host_load5', '5-minute load average'),
+    'load15': ('host_load15', '15-minute load average'),
+    'network_receive_bytes_per_second': ('host_network_receive_bytes_per_second', 'Bytes received per second per interface'),
+    'network_transmit_bytes_per_second': ('host_network_transmit_bytes_per_second', 'Bytes sent per second per interface'),
+    'disk_read_bytes_per_second': ('host_disk_read_bytes_per_second', 'Bytes read per second per disk'),
+    'disk_write_bytes_per_second': ('host_disk_write_bytes_per_second', 'Bytes written per second per disk'),
+    'filesystem_usage': ('host_filesystem_usage', 'Filesystem usage percent per mountpoint'),
+    'filesystem_free_bytes': ('host_filesystem_free_bytes', 'Free bytes per mountpoint'),
+    'process_count': ('host_process_count', 'Running processes'),
+    'process_cpu_usage': ('host_process_cpu_usage', 'CPU usage percent of the busiest processes'),
+    'process_resident_memory_bytes': ('host_process_resident_memory_bytes', 'Resident memory of the busiest processes'),
+}
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+_LABELED_KEY = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)\{(.*)\}$')
+_LABEL_PAIR = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\.)*)"(?:,|$)')
+_UNESCAPE = re.compile(r'\\(.)')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def metric_key(name, **labels):
+    """Payload key for a labeled sample, e.g. cpu_core_usage{core="0"}"""
+    if not labels:
+        return name
+    pairs = ','.join(f'{label}="{_escape(value)}"' for label, value in sorted(labels.items()))
+    return f'{name}{{{pairs}}}'
+
+
+def split_key(key):
+    """(name, {label: value}) for a payload key; labels are empty for plain keys"""
+    match = _LABELED_KEY.match(key)
+    if not match:
+        return key, {}
+    labels = {
+        label: _UNESCAPE.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+        for label, value in _LABEL_PAIR.findall(match.group(2))
+    }
+    return match.group(1), labels
+
+
+def metric_family(name):
+    """(family name, help) a payload name is exported under; unknown names are sanitized like the server does"""
+    known = METRIC_FAMILIES.get(name)
+    if known:
+        return known
+    family = _INVALID_NAME_CHARS.sub('_', name)
+    family = f'_{family}' if family[:1].isdigit() else family
+    return family, f'Collected metric {family}'
+
+
+def register_collector(cls):
+    COLLECTORS[cls.name] = cls
+    return cls
+
+
+class Collector:
+    """Base class for a metrics collector
+
+    collect() returns a dict of payload key -> number and is called once per
+    tick from a worker thread. timeout overrides COLLECT_TIMEOUT.
+    """
+
+    name = None
+    timeout = None
+
+    def collect(self):
+        raise NotImplementedError
+
+
+class RateCollector(Collector):
+    """Collector turning cumulative counters into per-second rates between ticks"""
+
+    def __init__(self):
+        self._previous = {}
+
+    def rates(self, counters):
+        """Per-second rates of counters since the last call; counters that reset are skipped"""
+        now = time.monotonic()
+        previous, self._previous = self._previous, {key: (value, now) for key, value in counters.items()}
+        rates = {}
+        for key, value in counters.items():
+            if key not in previous:
+                continue
+            last_value, last_time = previous[key]
+            if value >= last_value and now > last_time:
+                rates[key] = (value - last_value) / (now - last_time)
+        return rates
+
+
+@register_collector
+class SystemCollector(Collector):
+    """CPU, memory and root disk usage; CPU is the average since the previous tick"""
+
+    name = 'system'
+
+    def collect(self):
+        disk = psutil.disk_usage('/')
+        return {
+            'cpu_usage': psutil.cpu_percent(interval=None),
+            'memory_usage': psutil.virtual_memory().percent,
+            'disk_usage': (disk.used / disk.total) * 100
+        }
+
+
+@register_collector
+class MySQLCollector(Collector):
+    name = 'mysql'
+
+    def __init__(self):
+        # Pooled MySQL connection reused across cycles
+        self.db_collector = DBMetricsCollector()
+
+    def collect(self):
+        return self.db_collector.collect()
+
+
+@register_collector
+class CPUCoresCollector(Collector):
+    name = 'cpu_cores'
+
+    def collect(self):
+        return {
+            metric_key('cpu_core_usage', core=core): percent
+            for core, percent in enumerate(psutil.cpu_percent(interval=None, percpu=True))
+        }
+
+
+@register_collector
+class LoadCollector(Collector):
+    name = 'load'
+
+    def collect(self):
+        load1, load5, load15 = psutil.getloadavg()
+        return {'load1': load1, 'load5': load5, 'load15': load15, 'cpu_count': psutil.cpu_count()}
+
+
+@register_collector
+class NetworkCollector(RateCollector):
+    name = 'network'
+
+    def collect(self):
+        counters = {}
+        for interface, io in psutil.net_io_counters(pernic=True).items():
+            if interface == 'lo':
+                continue
+            counters[metric_key('network_receive_bytes_per_second', interface=interface)] = io.bytes_recv
+            counters[metric_key('network_transmit_bytes_per_second', interface=interface)] = io.bytes_sent
+        return self.rates(counters)
+
+
+@register_collector
+class DiskIOCollector(RateCollector):
+    name = 'diskio'
+
+    def collect(self):
+        counters = {}
+        for device, io in (psutil.disk_io_counters(perdisk=True) or {}).items():
+            if device.startswith(('loop', 'ram')):
+                continue
+            counters[metric_key('disk_read_bytes_per_second', device=device)] = io.read_bytes
+            counters[metric_key('disk_write_bytes_per_second', device=device)] = io.write_bytes
+        return self.rates(counters)
+
+
+@register_collector
+class MountsCollector(Collector):
+    name = 'mounts'
+
+    def collect(self):
+        metrics = {}
+        for partition in psutil.disk_partitions(all=False):
+            try:
+                usage = psutil.disk_usage(partition.mountpoint)
+            except OSError:
+                continue
+            metrics[metric_key('filesystem_usage', mountpoint=partition.mountpoint)] = usage.percent
+            metrics[metric_key('filesystem_free_bytes', mountpoint=partition.mountpoint)] = usage.free
+        return metrics
+
+
+@register_collector
+class ProcessesCollector(Collector):
+    """Top PROCESS_TOP_N processes by CPU; psutil keeps the Process objects, so CPU is per tick"""
+
+    name = 'processes'
+
+    def __init__(self):
+        self.top_n = int(os.getenv('PROCESS_TOP_N', '5'))
+
+    def collect(self):
+        processes = []
+        for process in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info']):
+            info = process.info
+            if info['cpu_percent'] is None or info['memory_info'] is None:
+                continue
+            processes.append(info)
+        processes.sort(key=lambda info: info['cpu_percent'], reverse=True)
+
+        metrics = {'process_count': len(processes)}
+        for info in processes[:self.top_n]:
+            labels = {'pid': info['pid'], 'process': info['name'] or ''}
+            metrics[metric_key('process_cpu_usage', **labels)] = info['cpu_percent']
+            metrics[metric_key('process_resident_memory_bytes', **labels)] = info['memory_info'].rss
+        return metrics
+
+
+def collector_name(collector):
+    return collector.name or type(collector).__name__
+
+
+def load_collector(name):
+    if ':' in name:
+        module_name, class_name = name.split(':', 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    return COLLECTORS[name]()
+
+
+def enabled_collectors():
+    """Collectors named in COLLECTORS minus COLLECTORS_DISABLED; unknown names are reported and skipped"""
+    names = [name.strip() for name in os.getenv('COLLECTORS', DEFAULT_COLLECTORS).split(',') if name.strip()]
+    disabled = {name.strip() for name in os.getenv('COLLECTORS_DISABLED', '').split(',')}
+    collectors = []
+    for name in names:
+        if name in disabled:
+            continue
+        try:
+            collectors.append(load_collector(name))
+        except Exception as e:
+            log.warning("⚠️ Collector unavailable", extra={'collector': name, 'error': str(e)})
+    # Prime cumulative psutil counters so the first tick reports usage since startup
+    psutil.cpu_percent(interval=None)
+    psutil.cpu_percent(interval=None, percpu=True)
+    log.info("🧩 Collectors enabled", extra={'collectors': ','.join(collector_name(collector) for collector in collectors)})
+    return collectors
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import logging
+import os
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import errors, pooling
+
+log = logging.getLogger(__name__)
+
+# Conditions counted per table layout; columns a table lacks are reported as 0
+TABLE_COUNTS = {
+    'video_uploads': {
+        'videos_processed': ("is_processed = 1 AND progress_value = 100", ('is_processed', 'progress_value')),
+        'videos_error': ("error_message IS NOT NULL", ('error_message',)),
+        'site_statics': ("site_statics_uploaded = 1", ('site_statics_uploaded',)),
+        'videos_not_processed': ("is_processed = 0 OR progress_value < 100", ('is_processed', 'progress_value')),
+    },
+    'uploads': {
+        'videos_processed': ("status = 'completed'", ('status',)),
+        'videos_error': ("error_message IS NOT NULL", ('error_message',)),
+        'site_statics': ("site_statics_uploaded = 1", ('site_statics_uploaded',)),
+        'videos_not_processed': ("status != 'completed'", ('status',)),
+    },
+}
+
+EMPTY_METRICS = {
+    'mysql_connections': 0,
+    'videos_processed': 0,
+    'videos_error': 0,
+    'site_statics': 0,
+    'videos_not_processed': 0,
+}
+
+
+class IncrementalCounts:
+    """Running per-condition totals maintained from changed rows only
+
+    Each row's condition bits are kept in a bytearray indexed by id
+    (auto-increment ids are dense), so a changed row can be uncounted from
+    its previous state before being counted in its new one.
+    """
+
+    def __init__(self, size):
+        self.totals = [0] * size
+        self.high_water = None
+        self.max_id = 0
+        self.reconciled_at = time.time()
+        self._base = None
+        self._flags = bytearray()
+        self._overflow = {}
+
+    def _get(self, row_id):
+        if self._base is None or row_id < self._base:
+            return self._overflow.get(row_id, 0)
+        index = row_id - self._base
+        return self._flags[index] if index < len(self._flags) else 0
+
+    def _set(self, row_id, flags):
+        if self._base is None:
+            self._base = row_id
+        if row_id < self._base:
+            self._overflow[row_id] = flags
+            return
+        index = row_id - self._base
+        if index >= len(self._flags):
+            self._flags.extend(bytes(index - len(self._flags) + 1024))
+        self._flags[index] = flags
+
+    def apply(self, rows):
+        """Fold (id, flags, updated_at) rows into the totals"""
+        for row_id, flags, updated_at in rows:
+            flags = int(flags)
+            old = self._get(row_id)
+            if old != flags:
+                changed = old ^ flags
+                for bit in range(len(self.totals)):
+                    if changed >> bit & 1:
+                        self.totals[bit] += 1 if flags >> bit & 1 else -1
+                self._set(row_id, flags)
+            if row_id > self.max_id:
+                self.max_id = row_id
+            if updated_at is not None and (self.high_water is None or updated_at > self.high_water):
+                self.high_water = updated_at
+
+
+class DBMetricsCollector:
+    """MySQL metrics over a long-lived connection pool
+
+    The uploads table layout is detected once and cached. In 'full' mode each
+    cycle runs a single conditional-aggregate query; in 'incremental' mode
+    only rows changed since the last cycle (by updated_at/id) are read, with
+    a full reconciliation every DB_RECONCILE_INTERVAL seconds. Reconciliation
+    reads the whole table, so it runs in a background thread on its own
+    connection while ticks keep reporting the previous totals.
+    """
+
+    def __init__(self):
+        self.config = {
+            'host': os.getenv('DB_HOST', 'localhost'),
+            'user': os.getenv('DB_USER', 'root'),
+            'password': os.getenv('DB_PASSWORD', 'password'),
+            'database': os.getenv('DB_NAME', 'take_leap'),
+            'port': int(os.getenv('DB_PORT', '3306')),
+            'connect_timeout': 5,
+            'autocommit': True
+        }
+        self.pool_size = int(os.getenv('DB_POOL_SIZE', '2'))
+        self.mode = os.getenv('DB_METRICS_MODE', 'full')
+        self.reconcile_interval = float(os.getenv('DB_RECONCILE_INTERVAL', '3600'))
+        # Re-read rows updated this far behind the high-water mark, for transactions committed late
+        self.overlap = int(os.getenv('DB_INCREMENTAL_OVERLAP', '60'))
+        self._pool = None
+        self._schema = None
+        self._counts = None
+        self._reconcile_thread = None
+
+    def _connection(self):
+        # The pool reconnects stale connections when handing them out
+        if self._pool is None:
+            self._pool = pooling.MySQLConnectionPool(
+                pool_name='monitoring', pool_size=self.pool_size, **self.config
+            )
+        return self._pool.get_connection()
+
+    def _detect_schema(self, cursor):
+        """Find the uploads table and which counted conditions it supports"""
+        cursor.execute(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = %s AND table_name IN ('video_uploads', 'uploads')",
+            (self.config['database'],)
+        )
+        columns = {}
+        for table, column in cursor.fetchall():
+            columns.setdefault(table, set()).add(column)
+
+        for table, counts in TABLE_COUNTS.items():
+            if table not in columns:
+                continue
+            conditions = [
+                condition if columns[table].issuperset(required) else None
+                for condition, required in counts.values()
+            ]
+            incremental = self.mode == 'incremental' and {'id', 'updated_at'} <= columns[table]
+            if self.mode == 'incremental' and not incremental:
+                log.warning("⚠️ Table has no id/updated_at columns, using full counts", extra={'table': table})
+            elif incremental and not self._has_index(cursor, table, 'updated_at'):
+                # Without one, every incremental read scans the table like a full count
+                log.warning("⚠️ Table has no index on updated_at, using full counts", extra={'table': table})
+                incremental = False
+            log.info("🗄️ Using table for video metrics", extra={'table': table, 'mode': 'incremental' if incremental else 'full'})
+            return {'table': table, 'names': list(counts), 'conditions': conditions, 'incremental': incremental}
+
+        log.warning("⚠️ No video_uploads/uploads table found, reporting 0 for video metrics")
+        return None
+
+    def _has_index(self, cursor, table, column):
+        """Whether an index of table starts with column, so range reads on it can use the index"""
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = %s AND table_name = %s AND column_name = %s AND seq_in_index = 1 LIMIT 1",
+            (self.config['database'], table, column)
+        )
+        return bool(cursor.fetchall())
+
+    def _full_counts(self, cursor, schema):
+        expressions = [
+            f"COALESCE(SUM(CASE WHEN {condition} THEN 1 ELSE 0 END), 0)" if condition else "0"
+            for condition in schema['conditions']
+        ]
+        cursor.execute(f"SELECT {', '.join(expressions)} FROM {schema['table']}")
+        return [int(value) for value in cursor.fetchone()]
+
+    def _incremental_counts(self, cursor, schema):
+        # One bit per counted condition, so a row's state fits in a byte
+        flags = ' | '.join(
+            f"(CASE WHEN {condition} THEN {1 << bit} ELSE 0 END)"
+            for bit, condition in enumerate(schema['conditions']) if condition
+        ) or '0'
+        select = f"SELECT id, {flags}, updated_at FROM {schema['table']}"
+
+        counts = self._counts
+        if counts is None or time.time() - counts.reconciled_at >= self.reconcile_interval:
+            self._start_reconcile(schema, select)
+        if counts is None:
+            # Nothing to report until the first recount is done
+            return None
+        if counts.high_water is None:
+            cursor.execute(select + " WHERE id > %s", (counts.max_id,))
+            counts.apply(cursor.fetchall())
+        else:
+            cursor.execute(
+                select + " WHERE updated_at >= %s - INTERVAL %s SECOND OR id > %s",
+                (counts.high_water, self.overlap, counts.max_id)
+            )
+            counts.apply(cursor.fetchall())
+        return counts.totals
+
+    def _start_reconcile(self, schema, select):
+        if self._reconcile_thread is not None and self._reconcile_thread.is_alive():
+            return
+        self._reconcile_thread = threading.Thread(
+            target=self._reconcile, args=(schema, select), name='db-reconcile', daemon=True
+        )
+        self._reconcile_thread.start()
+
+    def _reconcile(self, schema, select):
+        """Recount the whole table into fresh totals, then swap them in"""
+        started = time.time()
+        try:
+            # Its own connection, so a long read doesn't hold one of the pool's
+            conn = mysql.connector.connect(**self.config)
+            try:
+                counts = IncrementalCounts(len(schema['names']))
+                cursor = conn.cursor()
+                cursor.execute(select + " ORDER BY id")
+                while True:
+                    rows = cursor.fetchmany(10000)
+                    if not rows:
+                        break
+                    counts.apply(rows)
+                cursor.close()
+            finally:
+                conn.close()
+        except Exception as e:
+            log.error("❌ Reconciling video counts failed", extra={'error': str(e)})
+            return
+        # Rows changed during the read are picked up by the next tick from counts' high-water mark
+        if self._schema is schema:
+            self._counts = counts
+        log.info("🔁 Reconciled video counts", extra={'max_id': counts.max_id, 'duration_s': round(time.time() - started, 2)})
+
+    def collect(self):
+        """Return a dict of DB metrics; all zeros when the database is unavailable"""
+        metrics = dict(EMPTY_METRICS)
+        try:
+            conn = self._connection()
+            try:
+                cursor = conn.cursor()
+
+                # Get active connections
+                cursor.execute("SHOW STATUS LIKE 'Threads_connected'")
+                metrics['mysql_connections'] = int(cursor.fetchone()[1])
+
+                if self._schema is None:
+                    self._schema = self._detect_schema(cursor) or {}
+                schema = self._schema
+                if schema:
+                    if schema['incremental']:
+                        totals = self._incremental_counts(cursor, schema)
+                    else:
+                        totals = self._full_counts(cursor, schema)
+                    if totals is None:
+                        # Left out rather than reported as 0 while the first recount runs
+                        for name in schema['names']:
+                            metrics.pop(name, None)
+                    else:
+                        metrics.update(zip(schema['names'], totals))
+
+                cursor.close()
+            finally:
+                conn.close()
+        except mysql.connector.Error as e:
+            # A changed schema means re-detecting it (and recounting); a lost server, a new pool
+            if isinstance(e, errors.ProgrammingError):
+                self._schema = None
+                self._counts = None
+            if isinstance(e, (errors.InterfaceError, errors.OperationalError, errors.PoolError)):
+                self._pool = None
+            log.error("❌ Database error", extra={'error': str(e), 'sample': 'db_error'})
+        except Exception as e:
+            log.error("❌ Database error", extra={'error': str(e), 'sample': 'db_error'})
+        return metrics
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import threading
+
+
+class DeltaEncoder:
+    """Turns full samples into deltas against the previous one, with periodic keyframes
+
+    A delta carries only the metrics that changed, the keys that disappeared
+    ("removed") and the timestamp of the sample it applies to ("base"). Every
+    keyframe_every-th sample, and the first one after reset(), is sent in full.
+    """
+
+    def __init__(self, keyframe_every=20):
+        self.keyframe_every = keyframe_every
+        self._lock = threading.Lock()
+        self._previous = None
+        self._since_keyframe = 0
+
+    def encode(self, sample):
+        with self._lock:
+            previous = self._previous
+            self._previous = sample
+            if (previous is None or self._since_keyframe + 1 >= self.keyframe_every
+                    or previous['client_id'] != sample['client_id']
+                    or previous['timestamp'] >= sample['timestamp']):
+                self._since_keyframe = 0
+                return sample
+            self._since_keyframe += 1
+
+        last = previous['metrics']
+        metrics = sample['metrics']
+        delta = {
+            'client_id': sample['client_id'],
+            'timestamp': sample['timestamp'],
+            'delta': True,
+            'base': previous['timestamp'],
+            'metrics': {key: value for key, value in metrics.items() if key not in last or last[key] != value}
+        }
+        removed = [key for key in last if key not in metrics]
+        if removed:
+            delta['removed'] = removed
+        return delta
+
+    def reset(self):
+        """Send the next sample in full (after a failed push or a server resync request)"""
+        with self._lock:
+            self._previous = None
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import logging
+import os
+import socket
+import threading
+import time
+
+import requests
+
+log = logging.getLogger(__name__)
+
+IP_SERVICES = [
+    'https://ifconfig.me/ip',
+    'https://api.ipify.org',
+    'https://ipecho.net/plain',
+    'https://icanhazip.com'
+]
+
+
+def get_local_ip():
+    """Get the local IP address (fallback)"""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except:
+        return socket.gethostbyname(socket.gethostname())
+
+
+def lookup_public_ip(timeout=5):
+    """Ask the IP echo services in turn; None if none of them answer"""
+    for service in IP_SERVICES:
+        try:
+            response = requests.get(service, timeout=timeout)
+            if response.status_code == 200 and response.text.strip():
+                return response.text.strip()
+        except Exception as e:
+            log.warning("⚠️ Failed to get IP from service", extra={'provider': service, 'error': str(e)})
+    return None
+
+
+class PublicIP:
+    """Public IP resolved once at startup and refreshed in the background
+
+    get() never blocks on the network after the first call. PUBLIC_IP pins
+    the address and disables lookups entirely.
+    """
+
+    def __init__(self):
+        self.override = os.getenv('PUBLIC_IP', '').strip()
+        self.ttl = float(os.getenv('PUBLIC_IP_TTL', '3600'))
+        # Retry sooner while only the local fallback is known
+        self.retry_interval = float(os.getenv('PUBLIC_IP_RETRY', '60'))
+        self.timeout = float(os.getenv('PUBLIC_IP_TIMEOUT', '5'))
+        self._lock = threading.Lock()
+        self._ip = self.override or None
+        self._detected = bool(self.override)
+        self._thread = None
+
+    def refresh(self):
+        """Look the address up now; keeps the last known one when every service fails"""
+        ip = lookup_public_ip(self.timeout)
+        with self._lock:
+            if ip:
+                if ip != self._ip:
+                    log.info("✅ Detected public IP", extra={'ip': ip})
+                self._ip = ip
+                self._detected = True
+            elif self._ip is None:
+                self._ip = get_local_ip()
+                log.warning("⚠️ Could not detect public IP, using local IP", extra={'ip': self._ip})
+            return self._ip
+
+    def _run(self):
+        while True:
+            time.sleep(self.ttl if self._detected else self.retry_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                log.error("❌ Public IP refresh failed", extra={'error': str(e)})
+
+    def get(self):
+        if self._ip is None:
+            self.refresh()
+        if self._thread is None and not self.override:
+            self._thread = threading.Thread(target=self._run, name='public-ip', daemon=True)
+            self._thread.start()
+        return self._ip
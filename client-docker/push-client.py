@@ -1,179 +1,189 @@
 #!/usr/bin/env python3
 import requests
 import socket
+import gzip
 import json
+import logging
 import time
 import os
-import psutil
-import mysql.connector
+import threading
+from collectors import collector_name, enabled_collectors, metric_key
+from delta import DeltaEncoder
+from public_ip import PublicIP
+from scheduler import CollectionScheduler
+from sharding import ShardRouter, parse_shards
+from log_config import setup_logging
+from spool import DiskSpool
 
-def get_public_ip():
-    """Get the public IP address"""
-    try:
-        services = [
-            'https://ifconfig.me/ip',
-            'https://api.ipify.org',
-            'https://icanhazip.com'
-        ]
-        
-        for service in services:
-            try:
-                response = requests.get(service, timeout=10)
-                if response.status_code == 200:
-                    public_ip = response.text.strip()
-                    print(f"✅ Detected public IP: {public_ip}")
-                    return public_ip
-            except Exception as e:
-                continue
-        
-        return get_local_ip()
-    except Exception as e:
-        return get_local_ip()
+# Logging goes through a queue to a writer thread, so collection never waits on stdout
+setup_logging('push-client')
+log = logging.getLogger('push-client')
 
-def get_local_ip():
-    """Get the local IP address (fallback)"""
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except:
-        return socket.gethostbyname(socket.gethostname())
-
-def get_db_metrics():
-    """Get MySQL database metrics"""
-    try:
-        db_host = os.getenv('DB_HOST', 'localhost')
-        db_user = os.getenv('DB_USER', 'root')
-        db_password = os.getenv('DB_PASSWORD', 'password')
-        db_name = os.getenv('DB_NAME', 'take_leap')
-        db_port = int(os.getenv('DB_PORT', '3306'))
-        
-        conn = mysql.connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name,
-            port=db_port,
-            connect_timeout=5
-        )
-        cursor = conn.cursor()
-        
-        # Get active connections
-        cursor.execute("SHOW STATUS LIKE 'Threads_connected'")
-        connections = int(cursor.fetchone()[1])
-        
-        # Get processed videos count
-        try:
-            cursor.execute("SELECT COUNT(*) FROM video_uploads WHERE is_processed = 1 AND progress_value = 100")
-            videos_processed = cursor.fetchone()[0]
-        except mysql.connector.Error:
-            try:
-                cursor.execute("SELECT COUNT(*) FROM uploads WHERE status = 'completed'")
-                videos_processed = cursor.fetchone()[0]
-            except mysql.connector.Error:
-                videos_processed = 0
-        
-        # Get error videos count
-        try:
-            cursor.execute("SELECT COUNT(*) FROM video_uploads WHERE error_message IS NOT NULL")
-            videos_error = cursor.fetchone()[0]
-        except mysql.connector.Error:
-            try:
-                cursor.execute("SELECT COUNT(*) FROM uploads WHERE error_message IS NOT NULL")
-                videos_error = cursor.fetchone()[0]
-            except mysql.connector.Error:
-                videos_error = 0
-        
-        # Get site statistics count
-        try:
-            cursor.execute("SELECT COUNT(*) FROM video_uploads WHERE site_statics_uploaded = 1")
-            site_statics = cursor.fetchone()[0]
-        except mysql.connector.Error:
-            try:
-                cursor.execute("SELECT COUNT(*) FROM uploads WHERE site_statics_uploaded = 1")
-                site_statics = cursor.fetchone()[0]
-            except mysql.connector.Error:
-                site_statics = 0
-        
-        # Get videos not processed count
+# Samples collected per push; >1 ships them together in one {"batch": [...]} request
+PUSH_BATCH_SIZE = max(1, int(os.getenv('PUSH_BATCH_SIZE', '1')))
+# Gzip request bodies (Content-Encoding: gzip)
+PUSH_GZIP = os.getenv('PUSH_GZIP', '1') == '1'
+
+# Send only changed metrics (PUSH_DELTA=1), with a full sample every KEYFRAME_EVERY pushes
+PUSH_DELTA = os.getenv('PUSH_DELTA', '0') == '1'
+KEYFRAME_EVERY = int(os.getenv('KEYFRAME_EVERY', '20'))
+delta_encoder = DeltaEncoder(KEYFRAME_EVERY) if PUSH_DELTA else None
+
+# Central server; with CENTRAL_SHARDS (comma-separated server URLs) pushes go to the client's shard instead
+CENTRAL_HOST = os.getenv('CENTRAL_HOST', 'https://monitoring.takeleap.in')
+CENTRAL_SHARDS = parse_shards(os.getenv('CENTRAL_SHARDS', ''))
+router = ShardRouter(CENTRAL_HOST, CENTRAL_SHARDS)
+
+# Keep-alive connection to the central server, reused across pushes
+session = requests.Session()
+# Samples waiting for the batch to fill up, as (full sample, sample to send); the send
+# form may be a delta, but failed pushes are spooled in full so replay needs no server-side base
+pending_samples = []
+pending_lock = threading.Lock()
+
+# Failed pushes are spooled to disk (empty SPOOL_DIR disables) and replayed once the server is back
+SPOOL_DIR = os.getenv('SPOOL_DIR', '/app/spool')
+SPOOL_MAX_BYTES = int(os.getenv('SPOOL_MAX_BYTES', str(50 * 1024 * 1024)))
+# Replay rate limit: at most REPLAY_MAX_BATCHES batches of REPLAY_BATCH_SIZE samples per cycle
+REPLAY_BATCH_SIZE = int(os.getenv('REPLAY_BATCH_SIZE', '100'))
+REPLAY_MAX_BATCHES = int(os.getenv('REPLAY_MAX_BATCHES', '4'))
+
+spool = DiskSpool(SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES) if SPOOL_DIR else None
+
+# Resolved once at startup and refreshed in the background, so cycles never wait on it
+public_ip = PublicIP()
+
+# Collectors run concurrently on fixed COLLECT_INTERVAL ticks, each bounded by COLLECT_TIMEOUT
+COLLECT_INTERVAL = float(os.getenv('COLLECT_INTERVAL', '15'))
+COLLECT_TIMEOUT = float(os.getenv('COLLECT_TIMEOUT', '10'))
+scheduler = CollectionScheduler(COLLECT_INTERVAL, COLLECT_TIMEOUT)
+
+def push_payload(central_host, payload):
+    """POST a payload over the shared session, gzip-encoded when enabled"""
+    body = json.dumps(payload).encode()
+    headers = {'Content-Type': 'application/json'}
+    if PUSH_GZIP:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    return session.post(f"{central_host}/metrics", data=body, headers=headers, timeout=10)
+
+def is_retryable(response):
+    """Server-side trouble worth spooling for; 4xx means the payload itself was rejected"""
+    # 421: sent to the wrong shard, the owning one will take it
+    return response.status_code >= 500 or response.status_code in (421, 429)
+
+def spool_samples(samples):
+    if spool is None:
+        return
+    dropped = spool.dropped
+    spool.append(samples)
+    log.info("💾 Spooled samples", extra={'samples': len(samples), 'pending_kib': spool.size_bytes() // 1024})
+    if spool.dropped > dropped:
+        log.warning("⚠️ Spool full, dropped oldest samples", extra={'dropped': spool.dropped - dropped})
+
+def replay_spool(central_host):
+    """Replay spooled samples oldest-first in batches, stopping at the first failure"""
+    if not spool:
+        return
+    for _ in range(REPLAY_MAX_BATCHES):
+        samples, position = spool.read_batch(REPLAY_BATCH_SIZE)
+        if not samples:
+            return
         try:
-            cursor.execute("SELECT COUNT(*) FROM video_uploads WHERE is_processed = 0 OR progress_value < 100")
-            videos_not_processed = cursor.fetchone()[0]
-        except mysql.connector.Error:
-            try:
-                cursor.execute("SELECT COUNT(*) FROM uploads WHERE status != 'completed'")
-                videos_not_processed = cursor.fetchone()[0]
-            except mysql.connector.Error:
-                videos_not_processed = 0
-        
-        cursor.close()
-        conn.close()
-        
-        return connections, videos_processed, videos_error, site_statics, videos_not_processed
-        
-    except Exception as e:
-        print(f"Database error: {e}")
-        return 0, 0, 0, 0, 0
+            response = push_payload(central_host, {"batch": samples})
+        except Exception as e:
+            log.error("❌ Spool replay failed", extra={'error': str(e)})
+            return
+        if response.status_code != 200 and is_retryable(response):
+            log.error("❌ Spool replay failed", extra={'status': response.status_code})
+            return
+        if response.status_code != 200:
+            log.warning("⚠️ Server rejected spooled samples, discarding", extra={'samples': len(samples), 'status': response.status_code})
+        spool.commit(position)
+        log.info("📤 Replayed spooled samples", extra={'samples': len(samples)})
 
-def collect_and_push_metrics(central_host):
-    """Collect metrics and push to server"""
-    hostname = socket.gethostname()
-    client_id = f"{hostname}-{get_public_ip()}"
-    
-    # Collect system metrics
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
-    disk_percent = (disk.used / disk.total) * 100
-    
-    # Database metrics
-    db_connections, videos_processed, videos_error, site_statics, videos_not_processed = get_db_metrics()
-    
-    # Prepare metrics payload
-    metrics_data = {
-        "client_id": client_id,
-        "hostname": hostname,
-        "timestamp": int(time.time()),
-        "metrics": {
-            "cpu_usage": cpu_percent,
-            "memory_usage": memory.percent,
-            "disk_usage": disk_percent,
-            "mysql_connections": db_connections,
-            "videos_processed": videos_processed,
-            "videos_error": videos_error,
-            "site_statics": site_statics,
-            "videos_not_processed": videos_not_processed
-        }
+for collector in enabled_collectors():
+    scheduler.add(collector_name(collector), collector.collect, collector.timeout)
+
+def collection_durations():
+    """Seconds each collector (and the last push) took, pushed alongside the metrics"""
+    return {
+        metric_key('collector_duration_seconds', collector=name): round(seconds, 4)
+        for name, seconds in scheduler.durations().items()
     }
+
+def push_pending(central_host):
+    """Push waiting samples once a batch is full"""
+    with pending_lock:
+        if len(pending_samples) < PUSH_BATCH_SIZE:
+            return True
+        full_samples = [full for full, _ in pending_samples]
+        samples = [encoded for _, encoded in pending_samples]
+        pending_samples.clear()
+    payload = samples[0] if len(samples) == 1 else {"batch": samples}
     
     try:
         # Push metrics to server
-        response = requests.post(f"{central_host}/metrics", 
-                               json=metrics_data, timeout=10)
+        response = push_payload(central_host, payload)
         if response.status_code == 200:
-            print(f"✅ Metrics pushed: CPU={cpu_percent}%, Memory={memory.percent}%, Disk={disk_percent:.1f}%")
+            log.info("✅ Metrics pushed", extra={
+                'samples': len(samples), 'metrics': sum(len(sample['metrics']) for sample in samples),
+                'deltas': sum(1 for sample in samples if sample.get('delta'))
+            })
+            if delta_encoder and response.json().get('resync'):
+                # The server had no base for our deltas (e.g. it restarted); send a keyframe next
+                log.info("🔁 Server requested a full sample")
+                delta_encoder.reset()
+            # Server is reachable again; catch up on anything spooled during the outage
+            replay_spool(central_host)
             return True
         else:
-            print(f"❌ Failed to push metrics: {response.status_code}")
+            log.error("❌ Failed to push metrics", extra={'status': response.status_code})
+            if response.status_code == 421:
+                router.redirect(samples[-1]['client_id'], response.json().get('shard'))
+            if delta_encoder:
+                delta_encoder.reset()
+            if is_retryable(response):
+                spool_samples(full_samples)
             return False
     except Exception as e:
-        print(f"❌ Error pushing metrics: {e}")
+        log.error("❌ Error pushing metrics", extra={'error': str(e)})
+        if delta_encoder:
+            delta_encoder.reset()
+        spool_samples(full_samples)
         return False
 
+def collect_and_push_metrics(timestamp=None):
+    """Run the collectors concurrently, queue the sample and push in the background"""
+    hostname = socket.gethostname()
+    client_id = f"{hostname}-{public_ip.get()}"
+    central_host = router.host_for(client_id)
+    
+    metrics = scheduler.collect()
+    metrics.update(collection_durations())
+    
+    # Prepare metrics payload
+    metrics_data = {
+        "client_id": client_id,
+        "hostname": hostname,
+        "timestamp": int(timestamp or time.time()),
+        "metrics": metrics
+    }
+    
+    encoded = delta_encoder.encode(metrics_data) if delta_encoder else metrics_data
+    
+    with pending_lock:
+        pending_samples.append((metrics_data, encoded))
+    # A push still in flight picks these up next tick instead of blocking this one
+    scheduler.run_background('push', push_pending, central_host)
+
 if __name__ == '__main__':
     hostname = socket.gethostname()
-    central_host = os.getenv('CENTRAL_HOST', 'https://monitoring.takeleap.in')
     
-    print(f"🚀 Starting push-based client: {hostname}")
-    print(f"🌐 Central monitoring: {central_host}")
+    log.info("🚀 Starting push-based client", extra={
+        'hostname': hostname, 'central_host': router.host_for(f"{hostname}-{public_ip.get()}"),
+        'shards': len(CENTRAL_SHARDS) or None, 'public_ip': public_ip.get(),
+        'interval': COLLECT_INTERVAL, 'collector_timeout': COLLECT_TIMEOUT
+    })
     
-    # Main loop - push metrics every 15 seconds
-    while True:
-        try:
-            collect_and_push_metrics(central_host)
-            time.sleep(15)
-        except Exception as e:
-            print(f"Error: {e}")
-            time.sleep(5)
\ No newline at end of file
+    scheduler.run_forever(collect_and_push_metrics)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+log = logging.getLogger(__name__)
+
+
+class CollectionScheduler:
+    """Runs collectors concurrently on fixed wall-clock ticks
+
+    Ticks fall on multiples of the interval, so a slow cycle doesn't push
+    later samples back; a collector that overruns its timeout is left out of
+    that tick's sample and isn't started again until it has finished.
+    """
+
+    def __init__(self, interval=15, timeout=10, max_workers=8):
+        self.interval = interval
+        self.timeout = timeout
+        # Written from collector threads while the main thread reads them
+        self._durations = {}
+        self._durations_lock = threading.Lock()
+        self._collectors = {}
+        self._running = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='collector')
+
+    def add(self, name, collect, timeout=None):
+        """Register a collector returning a dict of metrics"""
+        self._collectors[name] = (collect, self.timeout if timeout is None else timeout)
+
+    def _busy(self, name):
+        future = self._running.get(name)
+        return future is not None and not future.done()
+
+    def _timed(self, name, fn, *args):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            with self._durations_lock:
+                self._durations[name] = time.monotonic() - started
+
+    def durations(self):
+        """{name: seconds} of each collector's and background job's last run, as a copy"""
+        with self._durations_lock:
+            return dict(self._durations)
+
+    def collect(self):
+        """Run every registered collector at once; metrics from those that finished in time"""
+        started = time.monotonic()
+        futures = {}
+        for name, (collect, _) in self._collectors.items():
+            if self._busy(name):
+                log.warning("⚠️ Collector still running from an earlier tick, skipping", extra={'collector': name})
+                continue
+            futures[name] = self._running[name] = self._executor.submit(self._timed, name, collect)
+
+        metrics = {}
+        for name, future in futures.items():
+            timeout = self._collectors[name][1]
+            try:
+                metrics.update(future.result(timeout=max(0, started + timeout - time.monotonic())))
+            except TimeoutError:
+                log.warning("⏱️ Collector timed out", extra={'collector': name, 'timeout': timeout})
+            except Exception as e:
+                log.error("❌ Collector failed", extra={'collector': name, 'error': str(e)})
+        return metrics
+
+    def run_background(self, name, fn, *args):
+        """Start fn without waiting for it; skipped (False) while the previous run is still going"""
+        if self._busy(name):
+            return False
+
+        def run():
+            try:
+                self._timed(name, fn, *args)
+            except Exception as e:
+                log.exception("❌ Background job failed", extra={'job': name})
+
+        self._running[name] = self._executor.submit(run)
+        return True
+
+    def run_forever(self, tick):
+        """Call tick(scheduled_time) on every interval boundary, skipping ticks that were overrun"""
+        next_tick = (time.time() // self.interval + 1) * self.interval
+        while True:
+            time.sleep(max(0, next_tick - time.time()))
+            try:
+                tick(next_tick)
+            except Exception as e:
+                log.exception("❌ Collection tick failed")
+            next_tick += self.interval
+            now = time.time()
+            if next_tick <= now:
+                missed = int((now - next_tick) // self.interval) + 1
+                log.warning("⚠️ Collection overran its interval, skipping ticks", extra={'interval': self.interval, 'skipped': missed})
+                next_tick += missed * self.interval
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import json
+import os
+
+
+class DiskSpool:
+    """Bounded on-disk FIFO of samples that could not be pushed
+
+    Samples are appended as JSON lines to numbered segment files. When the
+    spool grows past max_bytes the oldest segment is dropped. A small cursor
+    file remembers how far into the oldest segment replay has got, so a
+    restart resumes where it left off.
+    """
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, segment_bytes=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        self._cursor_path = os.path.join(directory, 'cursor')
+        self._segments = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.spool')
+        )
+        self._offset = self._load_cursor()
+
+    def _load_cursor(self):
+        try:
+            with open(self._cursor_path) as f:
+                cursor = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if self._segments and os.path.basename(self._segments[0]) == cursor.get('segment'):
+            return int(cursor.get('offset', 0))
+        return 0
+
+    def _save_cursor(self):
+        tmp_path = self._cursor_path + '.tmp'
+        segment = os.path.basename(self._segments[0]) if self._segments else None
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': segment, 'offset': self._offset}, f)
+        os.replace(tmp_path, self._cursor_path)
+
+    def _new_segment(self):
+        last = int(os.path.basename(self._segments[-1]).split('.')[0]) if self._segments else 0
+        path = os.path.join(self.directory, f'{last + 1:012d}.spool')
+        self._segments.append(path)
+        return path
+
+    def _drop_oldest(self):
+        path = self._segments.pop(0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._offset = 0
+        self._save_cursor()
+
+    def size_bytes(self):
+        return sum(os.path.getsize(path) for path in self._segments if os.path.exists(path))
+
+    def __bool__(self):
+        return bool(self._segments)
+
+    def append(self, samples):
+        """Spool samples at the tail, dropping the oldest segments beyond max_bytes"""
+        if not self._segments or os.path.getsize(self._segments[-1]) >= self.segment_bytes:
+            self._new_segment()
+        with open(self._segments[-1], 'a') as f:
+            for sample in samples:
+                f.write(json.dumps(sample, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        while len(self._segments) > 1 and self.size_bytes() > self.max_bytes:
+            with open(self._segments[0], 'rb') as f:
+                f.seek(self._offset)
+                self.dropped += f.read().count(b'\n')
+            self._drop_oldest()
+
+    def read_batch(self, max_samples):
+        """Oldest spooled samples and the position to commit() once they are delivered"""
+        while self._segments:
+            path = self._segments[0]
+            samples = []
+            position = self._offset
+            with open(path, 'rb') as f:
+                f.seek(position)
+                while len(samples) < max_samples:
+                    line = f.readline()
+                    # Stop at EOF or at a line cut short by a crash mid-write
+                    if not line.endswith(b'\n'):
+                        break
+                    position += len(line)
+                    try:
+                        samples.append(json.loads(line))
+                    except ValueError:
+                        continue
+            if samples:
+                return samples, (path, position)
+            if position > self._offset:
+                # Only corrupt lines were left; skip past them
+                self.commit((path, position))
+                continue
+            if len(self._segments) == 1:
+                return [], None
+            self._drop_oldest()
+        return [], None
+
+    def commit(self, position):
+        """Mark everything up to position as delivered"""
+        path, offset = position
+        if not self._segments or self._segments[0] != path:
+            return
+        self._offset = offset
+        if offset >= os.path.getsize(path):
+            self._drop_oldest()
+        else:
+            self._save_cursor()
@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
+import glob
+import json
+import os
 import socket
+import time
 import requests
 import subprocess
 import sys
 
+COMMON_PORTS = [22, 80, 443, 3000, 5000, 8000, 8080, 8118, 9000]
+
 def get_public_ip():
     """Get public IP address"""
     try:
@@ -36,7 +44,7 @@ def check_port_external(ip, port):
 
 def scan_common_ports():
     """Scan common ports for public accessibility"""
-    common_ports = [22, 80, 443, 3000, 5000, 8000, 8080, 8118, 9000]
+    common_ports = COMMON_PORTS
     public_ip = get_public_ip()
     
     if not public_ip:
@@ -91,12 +99,154 @@ def check_specific_port(port):
     else:
         print(f"⭕ No service running on port {port}")
 
+def split_target(target):
+    """'host:port' -> (host, port)"""
+    host, port = target.rsplit(':', 1)
+    return host.strip('[]'), int(port)
+
+def fleet_from_server(server_url, timeout=10):
+    """Registered clients from the central server's /clients as {hostname: target}"""
+    response = requests.get(f"{server_url.rstrip('/')}/clients", timeout=timeout)
+    response.raise_for_status()
+    return {client['hostname']: client['target'] for client in response.json()['clients']}
+
+def fleet_from_prometheus(config_path, timeout=10):
+    """Client targets from a Prometheus config as {hostname: target}
+
+    Reads legacy `client-<hostname>` static jobs and the targets behind the
+    clients job's file_sd/http_sd configs.
+    """
+    import yaml
+
+    with open(config_path) as f:
+        config = yaml.safe_load(f) or {}
+
+    groups = []
+    for job in config.get('scrape_configs') or []:
+        name = job['job_name']
+        if name.startswith('client-'):
+            for static in job.get('static_configs', []):
+                groups.append({'targets': static.get('targets', []), 'labels': {'client': name[len('client-'):]}})
+        for file_sd in job.get('file_sd_configs', []):
+            for pattern in file_sd.get('files', []):
+                pattern = os.path.join(os.path.dirname(config_path), pattern)
+                for path in glob.glob(pattern):
+                    with open(path) as f:
+                        groups.extend(json.load(f))
+        for http_sd in job.get('http_sd_configs', []):
+            response = requests.get(http_sd['url'], timeout=timeout)
+            response.raise_for_status()
+            groups.extend(response.json())
+
+    fleet = {}
+    for group in groups:
+        for target in group.get('targets', []):
+            fleet[group.get('labels', {}).get('client', target)] = target
+    return fleet
+
+async def probe_port(host, port, timeout, semaphore):
+    """Try a TCP connection; {'open', 'latency_ms', 'error'}"""
+    async with semaphore:
+        started = time.monotonic()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except asyncio.TimeoutError:
+            return {'open': False, 'latency_ms': None, 'error': 'timeout'}
+        except OSError as e:
+            return {'open': False, 'latency_ms': None, 'error': e.strerror or str(e)}
+        latency_ms = round((time.monotonic() - started) * 1000, 2)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return {'open': True, 'latency_ms': latency_ms, 'error': None}
+
+async def scan_fleet(fleet, ports, concurrency=200, timeout=2):
+    """Scan every client's host on the given ports (plus its agent port), at most concurrency at once"""
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    hosts = []
+    probes = []
+    for hostname, target in sorted(fleet.items()):
+        host, agent_port = split_target(target)
+        host_ports = sorted(set(ports) | {agent_port})
+        hosts.append({'hostname': hostname, 'host': host, 'target': target, 'ports': {}})
+        for port in host_ports:
+            probes.append((hosts[-1], port, probe_port(host, port, timeout, semaphore)))
+
+    results = await asyncio.gather(*(probe for _, _, probe in probes))
+    for (entry, port, _), result in zip(probes, results):
+        entry['ports'][str(port)] = result
+
+    return {
+        'scanned_at': int(time.time()),
+        'duration_s': round(time.monotonic() - started, 3),
+        'timeout_s': timeout,
+        'concurrency': concurrency,
+        'hosts': hosts,
+        'summary': {
+            'hosts': len(hosts),
+            'probes': len(probes),
+            'open': sum(1 for result in results if result['open']),
+            # Hosts whose own agent port doesn't answer
+            'agents_unreachable': sorted(
+                entry['hostname'] for entry in hosts
+                if not entry['ports'][str(split_target(entry['target'])[1])]['open']
+            )
+        }
+    }
+
+def print_fleet_report(report):
+    """Human-readable table of a fleet scan"""
+    for entry in report['hosts']:
+        open_ports = [port for port, result in entry['ports'].items() if result['open']]
+        print(f"{entry['hostname']}\t{entry['host']}\t{'✅ ' + ','.join(open_ports) if open_ports else '❌ none open'}")
+    summary = report['summary']
+    print("-" * 40)
+    print(f"🔍 {summary['hosts']} hosts, {summary['probes']} probes, {summary['open']} open in {report['duration_s']}s")
+    if summary['agents_unreachable']:
+        print(f"⚠️ Agent port unreachable: {', '.join(summary['agents_unreachable'])}")
+
+def scan_fleet_command(args):
+    """Fleet mode: scan every registered client and print a report"""
+    try:
+        if args.prometheus_config:
+            fleet = fleet_from_prometheus(args.prometheus_config)
+        else:
+            fleet = fleet_from_server(args.server)
+    except Exception as e:
+        print(f"❌ Could not load client list: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    ports = [int(port) for port in args.ports.split(',') if port.strip()] if args.ports else COMMON_PORTS
+    report = asyncio.run(scan_fleet(fleet, ports, args.concurrency, args.timeout))
+    if args.format == 'json':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_fleet_report(report)
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    parser = argparse.ArgumentParser(description="Check which ports are open locally and publicly, or across the fleet")
+    parser.add_argument('port', nargs='?', help="check a single port on this host")
+    parser.add_argument('--fleet', action='store_true', help="scan every registered client instead of this host")
+    parser.add_argument('--server', default=os.getenv('CENTRAL_HOST', 'http://localhost:5001'),
+                        help="central server whose /clients lists the fleet")
+    parser.add_argument('--prometheus-config', help="read client targets from a Prometheus config instead")
+    parser.add_argument('--ports', help="comma-separated ports to scan (default: common ports)")
+    parser.add_argument('--concurrency', type=int, default=200, help="connections attempted at once")
+    parser.add_argument('--timeout', type=float, default=2, help="connect timeout per probe (seconds)")
+    parser.add_argument('--format', choices=['json', 'text'], default='json', help="fleet report format")
+    args = parser.parse_args()
+
+    if args.fleet:
+        scan_fleet_command(args)
+    elif args.port is not None:
         try:
-            port = int(sys.argv[1])
+            port = int(args.port)
             check_specific_port(port)
         except ValueError:
             print("❌ Invalid port number")
     else:
-        scan_common_ports()
\ No newline at end of file
+        scan_common_ports()
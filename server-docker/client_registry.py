@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import yaml
+
+log = logging.getLogger(__name__)
+
+LEGACY_JOB_PREFIX = 'client-'
+CLIENTS_JOB = 'clients'
+
+
+def atomic_write(path, content):
+    """Write content to path via a temp file + rename so readers never see a partial file"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def clients_job(sd_url, file_sd_path=None, refresh_interval='30s'):
+    """Single scrape job whose targets come from the client registry"""
+    job = {'job_name': CLIENTS_JOB, 'scrape_interval': '15s'}
+    if file_sd_path:
+        job['file_sd_configs'] = [{'files': [file_sd_path], 'refresh_interval': refresh_interval}]
+    else:
+        job['http_sd_configs'] = [{'url': sd_url, 'refresh_interval': refresh_interval}]
+    return job
+
+
+def migrate_prometheus_config(config_path, job):
+    """Replace per-client static jobs with the service-discovery job
+
+    Returns (changed, legacy_targets) where legacy_targets maps hostname to
+    the target of every `client-<hostname>` job that was removed.
+    """
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+
+    scrape_configs = config.get('scrape_configs') or []
+    legacy_targets = {}
+    kept = []
+    for existing in scrape_configs:
+        name = existing['job_name']
+        if name.startswith(LEGACY_JOB_PREFIX):
+            targets = existing.get('static_configs', [{}])[0].get('targets', [])
+            if targets:
+                legacy_targets[name[len(LEGACY_JOB_PREFIX):]] = targets[0]
+        elif name != CLIENTS_JOB:
+            kept.append(existing)
+    kept.append(job)
+
+    if kept == scrape_configs:
+        return False, legacy_targets
+
+    config['scrape_configs'] = kept
+    atomic_write(config_path, yaml.dump(config, default_flow_style=False))
+    return True, legacy_targets
+
+
+class ClientRegistry:
+    """Authoritative hostname -> target index for registered clients"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._version = 0
+        self._rendered = None
+        self._rendered_version = -1
+
+    def upsert(self, hostname, ip, port):
+        """Add or update a client; returns (status, old_target)"""
+        target = f'{ip}:{port}'
+        with self._lock:
+            old_target = self._clients.get(hostname)
+            if old_target == target:
+                return 'unchanged', old_target
+            self._clients[hostname] = target
+            self._version += 1
+            return ('added' if old_target is None else 'updated'), old_target
+
+    def clients(self):
+        """Snapshot of registered clients as (hostname, target) pairs"""
+        with self._lock:
+            return list(self._clients.items())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+    def targets_json(self):
+        """Targets in Prometheus http_sd/file_sd format, re-rendered only after changes"""
+        with self._lock:
+            if self._rendered_version != self._version:
+                self._rendered = json.dumps([
+                    {'targets': [target], 'labels': {'client': hostname}}
+                    for hostname, target in self._clients.items()
+                ])
+                self._rendered_version = self._version
+            return self._rendered
+
+
+class DebouncedWriter:
+    """Coalesce change notifications into at most one atomic write per window"""
+
+    def __init__(self, path, render, window=2.0):
+        self.path = path
+        self.render = render
+        self.window = window
+        self._pending = threading.Event()
+        self._lock = threading.Lock()
+        self._last_content = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sd-writer', daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self):
+        self._pending.set()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            # Let registrations arriving within the window pile up behind this flush
+            time.sleep(self.window)
+            self._pending.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("❌ Failed to write file_sd targets", extra={'path': self.path, 'error': str(e)})
+
+    def flush(self):
+        """Write the rendered content if it changed; returns True when written"""
+        with self._lock:
+            content = self.render()
+            if content == self._last_content:
+                return False
+            atomic_write(self.path, content)
+            self._last_content = content
+
+        log.debug("💾 Flushed file_sd targets", extra={'path': self.path})
+        return True
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import logging
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# Distinct metric name layouts kept for sharing between records; past this the table starts over
+MAX_LAYOUTS = 10000
+_layouts = {}
+
+
+def _shared_layout(keys):
+    """One shared tuple per distinct set of metric names, so clients sending the same metrics share it"""
+    layout = _layouts.get(keys)
+    if layout is None:
+        if len(_layouts) >= MAX_LAYOUTS:
+            _layouts.clear()
+        layout = _layouts[keys] = tuple(sys.intern(key) for key in keys)
+    return layout
+
+
+class ClientRecord:
+    """A client's latest sample in a fixed layout
+
+    Metric names live in a tuple shared by every client with the same set and
+    values in a float array, instead of a dict of boxed numbers per client.
+    """
+
+    __slots__ = ('hostname', 'timestamp', 'last_seen', 'keys', 'values')
+
+    def __init__(self, hostname, timestamp, metrics, last_seen):
+        self.hostname = hostname
+        self.timestamp = timestamp
+        self.last_seen = last_seen
+        self.keys = _shared_layout(tuple(metrics))
+        self.values = array('d', metrics.values())
+
+    @property
+    def metrics(self):
+        return dict(zip(self.keys, self.values))
+
+    def to_dict(self):
+        return {
+            'hostname': self.hostname,
+            'timestamp': self.timestamp,
+            'metrics': self.metrics,
+            'last_seen': self.last_seen
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(record['hostname'], record['timestamp'], record['metrics'], record['last_seen'])
+
+
+class ClientStore:
+    """Latest pushed sample per client, bounded by TTL and a max-cardinality cap
+
+    Records are kept in push order, so both TTL sweeps and LRU evictions
+    only touch the oldest entries.
+    """
+
+    def __init__(self, ttl=600, max_clients=10000, sweep_interval=30, on_evict=None):
+        self.ttl = ttl
+        self.max_clients = max_clients
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+        self._evictions = {'ttl': 0, 'capacity': 0}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='store-sweeper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                evicted = self.sweep()
+                if evicted:
+                    log.info("🧹 Evicted silent clients", extra={'evicted': evicted, 'ttl': self.ttl})
+            except Exception as e:
+                log.exception("❌ Store sweep failed")
+
+    def put(self, client_id, record):
+        """Insert or refresh a client, evicting the least recently pushed one when full"""
+        evicted = []
+        with self._lock:
+            self._records[client_id] = record
+            self._records.move_to_end(client_id)
+            while len(self._records) > self.max_clients:
+                oldest, _ = self._records.popitem(last=False)
+                evicted.append(oldest)
+            self._evictions['capacity'] += len(evicted)
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+
+    def sweep(self, now=None):
+        """Drop clients whose last push is older than the TTL; returns how many"""
+        now = int(time.time()) if now is None else now
+        evicted = []
+        with self._lock:
+            while self._records:
+                client_id, record = next(iter(self._records.items()))
+                if now - record.last_seen <= self.ttl:
+                    break
+                del self._records[client_id]
+                evicted.append(client_id)
+            self._evictions['ttl'] += len(evicted)
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+        return len(evicted)
+
+    def get(self, client_id):
+        with self._lock:
+            return self._records.get(client_id)
+
+    def snapshot(self):
+        """Records as plain dicts keyed by client_id, in push order"""
+        with self._lock:
+            records = list(self._records.items())
+        return {client_id: record.to_dict() for client_id, record in records}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._records),
+                'max_clients': self.max_clients,
+                'ttl': self.ttl,
+                'evictions': dict(self._evictions)
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+import gzip
+import math
+import re
+import secrets
+import threading
+import time
+from collections import deque
+
+# Pushed samples older than this are left out of the scrape
+STALE_AFTER = 60
+
+# Payload keys of the built-in client metrics -> (family name, type, help); the clients name
+# their scraped gauges from the same table (METRIC_FAMILIES in client-docker/collectors.py)
+KNOWN_METRICS = {
+    'cpu_usage': ('host_cpu_usage', 'gauge', 'CPU usage percent'),
+    'memory_usage': ('host_memory_usage', 'gauge', 'Memory usage percent'),
+    'disk_usage': ('host_disk_usage', 'gauge', 'Root filesystem usage percent'),
+    'mysql_connections': ('mysql_active_connections', 'gauge', 'Active MySQL connections'),
+    'videos_processed': ('videos_processed_total', 'gauge', 'Videos fully processed'),
+    'videos_error': ('videos_error_total', 'gauge', 'Videos with an error message'),
+    'site_statics': ('site_statics_total', 'gauge', 'Videos with site statistics uploaded'),
+    'videos_not_processed': ('videos_not_processed_total', 'gauge', 'Videos not yet fully processed'),
+    'collector_duration_seconds': ('collector_duration_seconds', 'gauge', 'Seconds the last run of each collector took'),
+    'cpu_core_usage': ('host_cpu_core_usage', 'gauge', 'CPU usage percent per core'),
+    'cpu_count': ('host_cpu_count', 'gauge', 'Logical CPUs'),
+    'load1': ('host_load1', 'gauge', '1-minute load average'),
+    'load5': ('host_load5', 'gauge', '5-minute load average'),
+    'load15': ('host_load15', 'gauge', '15-minute load average'),
+    'network_receive_bytes_per_second': ('host_network_receive_bytes_per_second', 'gauge', 'Bytes received per second per interface'),
+    'network_transmit_bytes_per_second': ('host_network_transmit_bytes_per_second', 'gauge', 'Bytes sent per second per interface'),
+    'disk_read_bytes_per_second': ('host_disk_read_bytes_per_second', 'gauge', 'Bytes read per second per disk'),
+    'disk_write_bytes_per_second': ('host_disk_write_bytes_per_second', 'gauge', 'Bytes written per second per disk'),
+    'filesystem_usage': ('host_filesystem_usage', 'gauge', 'Filesystem usage percent per mountpoint'),
+    'filesystem_free_bytes': ('host_filesystem_free_bytes', 'gauge', 'Free bytes per mountpoint'),
+    'process_count': ('host_process_count', 'gauge', 'Running processes'),
+    'process_cpu_usage': ('host_process_cpu_usage', 'gauge', 'CPU usage percent of the busiest processes'),
+    'process_resident_memory_bytes': ('host_process_resident_memory_bytes', 'gauge', 'Resident memory of the busiest processes'),
+}
+KNOWN_FAMILIES = {name: (metric_type, help_text) for name, metric_type, help_text in KNOWN_METRICS.values()}
+FAMILY_ORDER = {name: i for i, (name, _, _) in enumerate(KNOWN_METRICS.values())}
+
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+# Collectors send labeled samples as 'name{label="value",...}' keys
+_LABELED_KEY = re.compile(r'^([^{]+)\{(.*)\}$')
+_LABEL_PAIR = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\.)*)"')
+_LABEL_BLOCK = re.compile(r'^(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*"(?:,(?!$)|$))*$')
+RESERVED_LABELS = {'client_id', 'hostname'}
+
+
+def family_name(key):
+    """Family name for a payload key; unknown keys become sanitized metric names"""
+    known = KNOWN_METRICS.get(key)
+    if known:
+        return known[0]
+    name = _INVALID_NAME_CHARS.sub('_', key)
+    return f'_{name}' if name[:1].isdigit() else name
+
+
+def family_info(name):
+    """(type, help) for a family; arbitrary pushed metrics are untyped"""
+    return KNOWN_FAMILIES.get(name, ('untyped', f'Pushed metric {name}'))
+
+
+def split_metric_key(key):
+    """(payload name, extra label text) for a key, or (None, None) when its labels are malformed"""
+    match = _LABELED_KEY.match(key)
+    if not match:
+        return key, ''
+    name, block = match.groups()
+    if not _LABEL_BLOCK.match(block):
+        return None, None
+    labels = _LABEL_PAIR.findall(block)
+    names = [label for label, _ in labels]
+    if RESERVED_LABELS.intersection(names) or len(set(names)) != len(names):
+        return None, None
+    return name, ''.join(f',{label}="{value}"' for label, value in labels)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN' if math.isnan(value) else ('+Inf' if value > 0 else '-Inf')
+    return repr(value)
+
+
+def render_client_samples(client_id, hostname, metrics):
+    """Sample lines for one client keyed by family, rendered once when its push arrives
+
+    Non-numeric values and malformed labeled keys are skipped so one odd
+    field can't break the scrape.
+    """
+    if not isinstance(metrics, dict):
+        raise ValueError("'metrics' must be an object")
+
+    labels = f'client_id="{escape_label_value(client_id)}",hostname="{escape_label_value(hostname)}"'
+    samples = {}
+    for key, value in metrics.items():
+        if isinstance(value, bool):
+            value = int(value)
+        elif not isinstance(value, (int, float)):
+            continue
+        if not key:
+            continue
+        key, extra = split_metric_key(key)
+        if not key:
+            continue
+        name = family_name(key)
+        # A family can hold several labeled samples per client, kept together as one block
+        samples[name] = samples.get(name, '') + f'{name}{{{labels}{extra}}} {format_value(value)}\n'
+    return samples
+
+
+def _timestamped(block, timestamp, openmetrics):
+    # Text format timestamps are in milliseconds, OpenMetrics ones in seconds
+    suffix = f' {format_value(timestamp)}\n' if openmetrics else f' {int(timestamp * 1000)}\n'
+    return ''.join(line + suffix for line in block.splitlines())
+
+
+class ExpositionCache:
+    """Pre-rendered sample lines grouped by family, assembled into a scrape body on demand
+
+    Each assembled variant (text/OpenMetrics, plain/gzip) is reused until a
+    client pushes again or the oldest included client goes stale. extra, if
+    given, returns server-computed families appended to every body.
+
+    Samples older than a client's latest (replayed from its spool, or batched
+    behind a newer one) are backfilled: exported with their own timestamps
+    for backfill_for seconds, at most max_backfill of them at a time.
+    """
+
+    def __init__(self, stale_after=STALE_AFTER, extra=None, backfill_for=60, max_backfill=50000):
+        self.stale_after = stale_after
+        self.extra = extra
+        self.backfill_for = backfill_for
+        self.max_backfill = max_backfill
+        self._lock = threading.Lock()
+        self._families = {}
+        self._clients = {}
+        # (expires_at, client_id, timestamp, samples), oldest first
+        self._backfill = deque()
+        self._version = 0
+        self._build = 0
+        # Build numbers restart with the process; the token keeps a restarted server's ETags from matching old ones
+        self._etag_token = secrets.token_hex(4)
+        self._cached = None
+
+    def update(self, client_id, samples, last_seen):
+        with self._lock:
+            previous = self._clients.get(client_id)
+            if previous:
+                # Drop families this client no longer sends
+                for name in previous[0].difference(samples):
+                    self._discard(name, client_id)
+            for name, line in samples.items():
+                self._families.setdefault(name, {})[client_id] = line
+            self._clients[client_id] = (frozenset(samples), last_seen)
+            self._version += 1
+
+    def backfill(self, client_id, samples, now):
+        """Export a client's older samples, [(timestamp, samples)], with their timestamps for a while"""
+        if self.max_backfill <= 0:
+            return
+        with self._lock:
+            for timestamp, lines in samples:
+                self._backfill.append((now + self.backfill_for, client_id, timestamp, lines))
+            while len(self._backfill) > self.max_backfill:
+                self._backfill.popleft()
+            self._version += 1
+
+    def remove(self, client_ids):
+        """Forget clients evicted from the store"""
+        with self._lock:
+            for client_id in client_ids:
+                previous = self._clients.pop(client_id, None)
+                if previous:
+                    for name in previous[0]:
+                        self._discard(name, client_id)
+            removed = set(client_ids)
+            self._backfill = deque(entry for entry in self._backfill if entry[1] not in removed)
+            self._version += 1
+
+    def _discard(self, name, client_id):
+        lines = self._families.get(name)
+        if lines is not None:
+            lines.pop(client_id, None)
+            if not lines:
+                del self._families[name]
+
+    def _render_body(self, fresh, openmetrics):
+        # Backfilled samples go ahead of the live ones, oldest first per client
+        backfill = {}
+        for _, client_id, timestamp, samples in sorted(self._backfill, key=lambda entry: (entry[1], entry[2])):
+            for name, block in samples.items():
+                backfill.setdefault(name, []).append(_timestamped(block, timestamp, openmetrics))
+
+        parts = []
+        names = set(self._families).union(backfill)
+        for name in sorted(names, key=lambda n: (FAMILY_ORDER.get(n, len(FAMILY_ORDER)), n)):
+            lines = backfill.get(name, [])
+            lines += [line for client_id, line in self._families.get(name, {}).items() if client_id in fresh]
+            if not lines:
+                continue
+            metric_type, help_text = family_info(name)
+            if openmetrics and metric_type == 'untyped':
+                metric_type = 'unknown'
+            parts.append(f'# HELP {name} {help_text}\n# TYPE {name} {metric_type}\n')
+            parts.extend(lines)
+        if self.extra:
+            parts.append(self.extra())
+        if openmetrics:
+            parts.append('# EOF\n')
+        return ''.join(parts).encode()
+
+    def render(self, openmetrics=False, gzipped=False, if_none_match=None):
+        """Return (etag, body); body is None when if_none_match matches the current etag"""
+        now = int(time.time())
+        with self._lock:
+            cached = self._cached
+            if cached is None or cached['version'] != self._version or now >= cached['expires_at']:
+                fresh = {cid for cid, (_, seen) in self._clients.items() if now - seen <= self.stale_after}
+                while self._backfill and self._backfill[0][0] <= now:
+                    self._backfill.popleft()
+                self._build += 1
+                cached = self._cached = {
+                    'version': self._version,
+                    'build': self._build,
+                    'fresh': fresh,
+                    'bodies': {},
+                    # The body changes once the oldest included client goes stale
+                    # or the oldest backfilled sample is due to be dropped
+                    'expires_at': min(
+                        min(self._clients[cid][1] for cid in fresh) + self.stale_after + 1 if fresh else float('inf'),
+                        self._backfill[0][0] if self._backfill else float('inf')
+                    )
+                }
+            if openmetrics not in cached['bodies']:
+                cached['bodies'][openmetrics] = self._render_body(cached['fresh'], openmetrics)
+
+        etag = f'"{self._etag_token}-{cached["build"]}{"-om" if openmetrics else ""}{"-gz" if gzipped else ""}"'
+        if if_none_match and etag in if_none_match:
+            return etag, None
+
+        body = cached['bodies'][openmetrics]
+        if not gzipped:
+            return etag, body
+        key = ('gzip', openmetrics)
+        if key not in cached['bodies']:
+            cached['bodies'][key] = gzip.compress(body, compresslevel=5)
+        return etag, cached['bodies'][key]
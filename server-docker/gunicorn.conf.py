@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# Production serving config, picked up by `gunicorn registration-server:app` from /app
+import atexit
+import multiprocessing.util
+import os
+import secrets
+
+from server_state import start_state_server
+
+bind = '0.0.0.0:5001'
+workers = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+STATE_SOCKET = os.getenv('STATE_SOCKET', '/tmp/registration-state.sock')
+
+_state_manager = None
+
+
+def on_starting(server):
+    """Start the shared state process before any worker is forked"""
+    global _state_manager
+    authkey = secrets.token_hex(16)
+    _state_manager = start_state_server(STATE_SOCKET, authkey.encode())
+    # Workers inherit these and connect to the state process instead of building their own
+    os.environ['STATE_ADDRESS'] = STATE_SOCKET
+    os.environ['STATE_AUTHKEY'] = authkey
+    server.log.info("Shared state process listening on %s", STATE_SOCKET)
+
+
+def post_fork(server, worker):
+    # Workers inherit the master's handle on the state process; their exit must not try to join it
+    atexit.unregister(multiprocessing.util._exit_function)
+
+
+def on_exit(server):
+    if _state_manager is not None:
+        try:
+            _state_manager.get_state().save_snapshot()
+        except Exception as e:
+            server.log.error("Final state snapshot failed: %s", e)
+        _state_manager.shutdown()
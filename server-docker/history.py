@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import math
+import threading
+from array import array
+from bisect import bisect_left
+
+NAN = math.nan
+
+
+def _json_number(value):
+    # NaN (a gap) and infinities have no JSON representation
+    return value if value is not None and math.isfinite(value) else None
+
+
+class SampleRing:
+    """Fixed-size ring of one client's recent samples
+
+    Timestamps and each metric's values sit in preallocated float arrays
+    indexed by slot; a metric missing from a sample is NaN in that slot.
+    A series is allocated when its metric is first seen, up to max_series.
+    """
+
+    __slots__ = ('capacity', 'max_series', 'timestamps', 'series', 'head', 'count')
+
+    def __init__(self, capacity, max_series):
+        self.capacity = capacity
+        self.max_series = max_series
+        self.timestamps = array('d', [NAN]) * capacity
+        self.series = {}
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp, metrics):
+        if not math.isfinite(timestamp):
+            return
+        last = (self.head - 1) % self.capacity
+        if self.count and self.timestamps[last] == timestamp:
+            # Same sample again (e.g. a replayed push); overwrite it
+            slot = last
+        elif self.count and self.timestamps[last] > timestamp:
+            slot = self._make_room(timestamp)
+            if slot is None:
+                return
+        else:
+            slot = self.head
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        self.timestamps[slot] = timestamp
+        for name, values in self.series.items():
+            values[slot] = metrics.get(name, NAN)
+        for name, value in metrics.items():
+            if name not in self.series and len(self.series) < self.max_series:
+                values = self.series[name] = array('d', [NAN]) * self.capacity
+                values[slot] = value
+
+    def _make_room(self, timestamp):
+        """Slot for a sample older than the newest one (batched or replayed), keeping slots in time order
+
+        Returns None when the ring is full and the sample is older than all of it.
+        """
+        timestamps = self._ordered(self.timestamps)
+        position = bisect_left(timestamps, timestamp)
+        if timestamps[position] == timestamp:
+            return position if self.count < self.capacity else (self.head + position) % self.capacity
+        if position == 0 and self.count == self.capacity:
+            return None
+        # Rewrite the ring oldest-first from slot 0 with a gap at position, dropping the oldest if full
+        drop = 1 if self.count == self.capacity else 0
+        for values in (self.timestamps, *self.series.values()):
+            ordered = self._ordered(values)
+            ordered = ordered[drop:position] + array('d', [NAN]) + ordered[position:]
+            values[:len(ordered)] = ordered
+        self.count = len(ordered)
+        self.head = self.count % self.capacity
+        return position - drop
+
+    def _ordered(self, values):
+        """Oldest-first copy of a slot array"""
+        if self.count < self.capacity:
+            return values[:self.count]
+        return values[self.head:] + values[:self.head]
+
+    def window(self, since, names=None):
+        """(timestamps, {name: values}) of the samples taken at or after since, oldest first"""
+        timestamps = self._ordered(self.timestamps)
+        start = bisect_left(timestamps, since)
+        names = self.series if names is None else [name for name in names if name in self.series]
+        return timestamps[start:], {name: self._ordered(self.series[name])[start:] for name in names}
+
+
+def summarize(timestamps, values):
+    """min/max/avg/last over a window, plus the per-second rate treating the series as a counter"""
+    points = [(t, v) for t, v in zip(timestamps, values) if v == v]
+    if not points:
+        return {'min': None, 'max': None, 'avg': None, 'last': None, 'rate': None}
+    present = [v for _, v in points]
+    rate = None
+    if len(points) > 1 and points[-1][0] > points[0][0]:
+        # A drop is a counter reset: count the new value as the increase, like Prometheus' rate()
+        increase = math.fsum(b if b < a else b - a for a, b in zip(present, present[1:]))
+        rate = increase / (points[-1][0] - points[0][0])
+    return {
+        'min': min(present),
+        'max': max(present),
+        'avg': math.fsum(present) / len(present),
+        'last': present[-1],
+        'rate': rate
+    }
+
+
+class SampleHistory:
+    """Recent samples per client in SampleRings, bounded like the client store"""
+
+    def __init__(self, capacity=40, max_series=100):
+        self.capacity = capacity
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._rings = {}
+
+    def append(self, client_id, timestamp, metrics):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            ring = self._rings.get(client_id)
+            if ring is None:
+                ring = self._rings[client_id] = SampleRing(self.capacity, self.max_series)
+            ring.append(timestamp, metrics)
+
+    def remove(self, client_ids):
+        """Forget clients evicted from the store"""
+        with self._lock:
+            for client_id in client_ids:
+                self._rings.pop(client_id, None)
+
+    def query(self, client_id, since, names=None, points=True):
+        """Window of a client's history with per-metric aggregates; None for unknown clients"""
+        with self._lock:
+            ring = self._rings.get(client_id)
+            if ring is None:
+                return None
+            timestamps, series = ring.window(since, names)
+
+        metrics = {}
+        for name, values in series.items():
+            metrics[name] = {key: _json_number(value) for key, value in summarize(timestamps, values).items()}
+            if points:
+                metrics[name]['values'] = [_json_number(value) for value in values]
+        result = {
+            'samples': len(timestamps),
+            'from': int(timestamps[0]) if timestamps else None,
+            'to': int(timestamps[-1]) if timestamps else None,
+            'metrics': metrics
+        }
+        if points:
+            result['timestamps'] = [int(t) for t in timestamps]
+        return result
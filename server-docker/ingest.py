@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import json
+import math
+import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    # Optional; the standard library decoder is used without it
+    orjson = None
+
+# Bounds on one push beyond its size in bytes
+MAX_BATCH_SAMPLES = int(os.getenv('MAX_BATCH_SAMPLES', '1000'))
+MAX_SAMPLE_METRICS = int(os.getenv('MAX_SAMPLE_METRICS', '2000'))
+MAX_ID_LENGTH = 256
+# How far ahead of the server's clock a sample's timestamp may be, in seconds
+MAX_CLOCK_SKEW = float(os.getenv('MAX_CLOCK_SKEW', '300'))
+
+_NUMBER = (int, float)
+
+# Field -> (accepted types, required); hostname is also required on keyframes and base on deltas
+SAMPLE_SCHEMA = {
+    'client_id': (str, True),
+    'hostname': (str, False),
+    'timestamp': (_NUMBER, True),
+    'metrics': (dict, True),
+    'delta': (bool, False),
+    'base': (_NUMBER, False),
+    'removed': (list, False),
+}
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class UndecodablePayload(SchemaError):
+    pass
+
+
+def decode_json(body):
+    if orjson is not None:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Python clients may send NaN/Infinity, which only the standard decoder accepts
+            pass
+    return json.loads(body)
+
+
+_TYPE_NAMES = {str: 'a string', dict: 'an object', list: 'a list', bool: 'true or false', _NUMBER: 'a number'}
+
+
+def _check_type(name, value, types):
+    # bool is an int subclass, so it never counts as a number
+    if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+        raise SchemaError(f"'{name}' must be {_TYPE_NAMES[types]}")
+
+
+def _finite(value):
+    """value as a finite float, or None; huge JSON integers overflow a float"""
+    try:
+        value = float(value)
+    except OverflowError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _check_timestamp(name, value, now):
+    value = _finite(value)
+    if value is None or value <= 0:
+        raise SchemaError(f"'{name}' must be a finite, positive number")
+    if value > now + MAX_CLOCK_SKEW:
+        raise SchemaError(f"'{name}' is more than {MAX_CLOCK_SKEW:g}s ahead of the server's clock")
+
+
+def validate_sample(sample, now=None):
+    """Check one pushed sample against SAMPLE_SCHEMA; returns it with only finite numeric metrics kept
+
+    Non-numeric metric values are dropped rather than rejected, as the scrape
+    has always skipped them, and so are NaN, infinities and integers too large
+    for a float; booleans become 0/1. Timestamps must be finite and no more
+    than MAX_CLOCK_SKEW ahead of the server's clock.
+    """
+    if not isinstance(sample, dict):
+        raise SchemaError("A sample must be an object")
+    for name, (types, required) in SAMPLE_SCHEMA.items():
+        if name in sample and sample[name] is not None:
+            _check_type(name, sample[name], types)
+        elif required:
+            raise SchemaError(f"Missing '{name}'")
+    now = time.time() if now is None else now
+    _check_timestamp('timestamp', sample['timestamp'], now)
+    if sample.get('base') is not None:
+        _check_timestamp('base', sample['base'], now)
+
+    client_id = sample['client_id']
+    if not client_id or len(client_id) > MAX_ID_LENGTH:
+        raise SchemaError(f"'client_id' must be 1-{MAX_ID_LENGTH} characters")
+    hostname = sample.get('hostname')
+    if sample.get('delta'):
+        if sample.get('base') is None:
+            raise SchemaError("A delta needs a 'base' timestamp")
+    elif not hostname:
+        raise SchemaError("Missing 'hostname'")
+    if hostname is not None and len(hostname) > MAX_ID_LENGTH:
+        raise SchemaError(f"'hostname' must be at most {MAX_ID_LENGTH} characters")
+
+    raw = sample['metrics']
+    if len(raw) > MAX_SAMPLE_METRICS:
+        raise SchemaError(f"More than {MAX_SAMPLE_METRICS} metrics in one sample")
+    metrics = {}
+    for key, value in raw.items():
+        if not key:
+            continue
+        if isinstance(value, bool):
+            metrics[key] = int(value)
+        elif isinstance(value, _NUMBER) and _finite(value) is not None:
+            metrics[key] = value
+    sample['metrics'] = metrics
+
+    removed = sample.get('removed')
+    if removed and not all(isinstance(key, str) for key in removed):
+        raise SchemaError("'removed' must be a list of strings")
+    return sample
+
+
+def parse_push(body):
+    """Decode and validate a push body (one sample or {"batch": [...]}); returns the samples"""
+    try:
+        payload = decode_json(body)
+    except ValueError as e:
+        raise UndecodablePayload(f"Invalid JSON: {e}") from None
+    if isinstance(payload, dict) and 'batch' in payload:
+        batch = payload['batch']
+        if not isinstance(batch, list):
+            raise SchemaError("'batch' must be a list")
+        if len(batch) > MAX_BATCH_SAMPLES:
+            raise SchemaError(f"More than {MAX_BATCH_SAMPLES} samples in one batch")
+    else:
+        batch = [payload]
+    now = time.time()
+    return [validate_sample(sample, now) for sample in batch]
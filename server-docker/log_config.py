@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Shared by the server and the clients; server-docker/ and client-docker/ each ship a copy
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'text' (human-readable, key=value fields) or 'json' (one object per line)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Records waiting for the writer thread; beyond this they are dropped rather than block the caller
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Only 1 in LOG_SAMPLE_EVERY records of a sampled event is written
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '100'))
+
+# Attributes every LogRecord has; anything else came in through extra= and is a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sample'}
+
+_listener = None
+_listener_pid = None
+_queue_handler = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record with extra= fields, as text or JSON"""
+
+    def __init__(self, fmt='text', service=None):
+        super().__init__()
+        self.json = fmt == 'json'
+        self.service = service
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        message = record.getMessage()
+        if self.json:
+            return json.dumps({
+                'ts': round(record.created, 3),
+                'level': record.levelname.lower(),
+                'service': self.service,
+                'logger': record.name,
+                'msg': message,
+                **fields
+            }, default=str, ensure_ascii=False)
+        line = f'{self.formatTime(record)} {record.levelname:<7} {record.name}: {message}'
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Let through the first and then every Nth record logged with extra={'sample': key}
+
+    Passed records carry sample_rate so readers can scale counts back up.
+    """
+
+    def __init__(self, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = every
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None or self.every <= 1:
+            return True
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = (count + 1) % self.every
+        if count:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that drops records when the writer falls behind instead of blocking"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(service):
+    """Route all logging through a queue to a single writer thread on stdout
+
+    Safe to call repeatedly; a forked child (gunicorn worker, state process)
+    gets its own writer thread since threads don't survive fork.
+    """
+    global _listener, _listener_pid, _queue_handler
+    if _listener_pid == os.getpid():
+        return
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter())
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(StructuredFormatter(LOG_FORMAT, service))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [_queue_handler]
+
+    first = _listener is None
+    _listener = QueueListener(log_queue, stream)
+    _listener.start()
+    _listener_pid = os.getpid()
+    if first:
+        atexit.register(_stop_listener)
+
+
+def _stop_listener():
+    # Flush what's queued; a forked child must not touch its parent's listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+def dropped_records():
+    """Records dropped in this process because the log queue was full"""
+    return _queue_handler.dropped if _queue_handler else 0
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from client_registry import atomic_write
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class StatePersistence:
+    """Periodic snapshot of the server state plus a write-ahead log of registrations
+
+    Registrations are appended to the WAL as they happen. Every interval the
+    state returned by capture() is written to a gzipped JSON snapshot and the
+    WAL entries it covers are discarded. load() returns the snapshot and the
+    registrations logged since, to be replayed on top of it.
+    """
+
+    def __init__(self, directory, capture, interval=30):
+        self.directory = directory
+        self.capture = capture
+        self.interval = interval
+        self.snapshot_path = os.path.join(directory, 'state.json.gz')
+        self.wal_path = os.path.join(directory, 'registrations.wal')
+        # WAL entries captured by a snapshot that isn't on disk yet
+        self._covered_path = self.wal_path + '.covered'
+        self._lock = threading.Lock()
+        # Held through a whole save so a shutdown save can't interleave with a periodic one
+        self._save_lock = threading.Lock()
+        self._wal = None
+        self._thread = None
+
+    def load(self):
+        """(snapshot dict, [(hostname, ip, port), ...] logged after it)"""
+        snapshot = {}
+        try:
+            with gzip.open(self.snapshot_path, 'rt') as f:
+                snapshot = json.load(f)
+            if snapshot.get('version') != SNAPSHOT_VERSION:
+                log.warning("⚠️ Ignoring snapshot with unknown version", extra={'version': snapshot.get('version')})
+                snapshot = {}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.error("❌ Unreadable state snapshot, starting empty", extra={'path': self.snapshot_path, 'error': str(e)})
+
+        registrations = []
+        for path in (self._covered_path, self.wal_path):
+            try:
+                with open(path) as f:
+                    for line in f:
+                        # A line cut short by a crash mid-write is skipped
+                        try:
+                            entry = json.loads(line)
+                            registrations.append((entry['hostname'], entry['ip'], int(entry['port'])))
+                        except (ValueError, KeyError, TypeError):
+                            continue
+            except FileNotFoundError:
+                continue
+        return snapshot, registrations
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            if self._wal is None:
+                self._wal = open(self.wal_path, 'a')
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='state-snapshot', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.save()
+            except Exception:
+                log.exception("❌ State snapshot failed")
+
+    def log_registration(self, hostname, ip, port):
+        """Append a registration to the WAL (log after updating the registry)"""
+        line = json.dumps({'hostname': hostname, 'ip': ip, 'port': port, 'at': int(time.time())}) + '\n'
+        with self._lock:
+            if self._wal is not None:
+                self._wal.write(line)
+                self._wal.flush()
+
+    def _rotate_wal(self):
+        """Move the current WAL aside as covered by the snapshot being taken"""
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        self._wal.close()
+        if os.path.exists(self._covered_path):
+            # The previous snapshot never made it to disk; keep its entries too
+            with open(self.wal_path, 'rb') as src, open(self._covered_path, 'ab') as dst:
+                dst.write(src.read())
+            os.remove(self.wal_path)
+        else:
+            os.replace(self.wal_path, self._covered_path)
+        self._wal = open(self.wal_path, 'a')
+
+    def save(self):
+        """Write a snapshot; called periodically and at shutdown"""
+        with self._save_lock:
+            started = time.perf_counter()
+            with self._lock:
+                if self._wal is None:
+                    return
+                # Registrations logged after this point land in the fresh WAL
+                state = self.capture()
+                self._rotate_wal()
+
+            state['version'] = SNAPSHOT_VERSION
+            state['written_at'] = int(time.time())
+            body = gzip.compress(json.dumps(state, separators=(',', ':')).encode(), compresslevel=5)
+            atomic_write(self.snapshot_path, body)
+            os.remove(self._covered_path)
+            log.debug("💾 Wrote state snapshot", extra={
+                'bytes': len(body), 'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            })
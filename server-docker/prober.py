@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+def tcp_probe(target, timeout):
+    """Open and close a TCP connection to host:port; returns (reachable, latency_ms, error)"""
+    host, port = target.rsplit(':', 1)
+    started = time.monotonic()
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            pass
+        return True, round((time.monotonic() - started) * 1000, 2), None
+    except OSError as e:
+        return False, None, str(e)
+
+
+class ReachabilityProber:
+    """Probe registered targets concurrently on a schedule and cache the results"""
+
+    def __init__(self, list_targets, interval=60, timeout=2, concurrency=32):
+        self.list_targets = list_targets
+        self.interval = interval
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='prober')
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._results = {}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='prober', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.probe_all()
+            except Exception as e:
+                log.exception("❌ Reachability sweep failed")
+            time.sleep(self.interval)
+
+    def probe(self, target):
+        """Probe one target now and cache the result"""
+        reachable, latency_ms, error = tcp_probe(target, self.timeout)
+        result = {
+            'reachable': reachable,
+            'latency_ms': latency_ms,
+            'error': error,
+            'checked_at': int(time.time())
+        }
+        with self._lock:
+            self._results[target] = result
+        return result
+
+    def probe_all(self):
+        """Probe every registered target with bounded concurrency"""
+        # Concurrent sweeps (scheduled + ?refresh=1) would only duplicate work
+        with self._sweep_lock:
+            targets = set(self.list_targets())
+            started = time.monotonic()
+            list(self._pool.map(self.probe, targets))
+            with self._lock:
+                for target in list(self._results):
+                    if target not in targets:
+                        del self._results[target]
+                reachable = len([r for r in self._results.values() if r['reachable']])
+        log.info("🔍 Reachability sweep done", extra={
+            'targets': len(targets), 'reachable': reachable, 'duration_s': round(time.monotonic() - started, 2)
+        })
+
+    def results(self):
+        """Snapshot of cached results keyed by target"""
+        with self._lock:
+            return {target: dict(result) for target, result in self._results.items()}
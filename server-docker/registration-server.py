@@ -1,271 +1,330 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify
-import yaml
+from flask import Flask, g, request, jsonify
+import logging
 import os
-import subprocess
+import threading
 import time
-from collections import defaultdict
+import zlib
+from exposition import OPENMETRICS_CONTENT_TYPE, TEXT_CONTENT_TYPE, render_client_samples
+from ingest import SchemaError, UndecodablePayload, parse_push
+from log_config import dropped_records, setup_logging
+from self_metrics import SelfMetrics, render_self_metrics
+from server_state import PROMETHEUS_CONFIG, PROMETHEUS_URL, SHARD_URL, SHARDS, foreign_shard, get_state, shard_ring
+from sharding import client_key
+
+# Logging goes through a queue to a writer thread, so request threads never wait on stdout
+setup_logging('registration-server')
+log = logging.getLogger('registration-server')
 
 app = Flask(__name__)
-PROMETHEUS_CONFIG = '/app/central-prometheus.yml'
 
-# In-memory storage for pushed metrics
-metrics_store = defaultdict(dict)
+# Registry, pushed metrics and background workers; shared across gunicorn workers
+state = get_state()
 
-def ensure_prometheus_config():
-    """Create Prometheus config if it doesn't exist"""
-    if not os.path.exists(PROMETHEUS_CONFIG):
-        default_config = {
-            'global': {
-                'evaluation_interval': '15s',
-                'scrape_interval': '15s'
-            },
-            'scrape_configs': [
-                {
-                    'job_name': 'prometheus',
-                    'static_configs': [{'targets': ['localhost:9090']}]
-                }
-            ]
-        }
-        os.makedirs(os.path.dirname(PROMETHEUS_CONFIG), exist_ok=True)
-        with open(PROMETHEUS_CONFIG, 'w') as f:
-            yaml.dump(default_config, f, default_flow_style=False)
-        print(f"✅ Created default Prometheus config at {PROMETHEUS_CONFIG}")
+# Upper bound on a decompressed push body
+MAX_PUSH_BYTES = int(os.getenv('MAX_PUSH_BYTES', str(1024 * 1024)))
+
+# This worker's request and ingest metrics, reported to the shared state every few seconds
+self_metrics = SelfMetrics()
+SELF_METRICS_FLUSH_INTERVAL = float(os.getenv('SELF_METRICS_FLUSH_INTERVAL', '5'))
+_reporter_pid = None
+
+class PayloadTooLarge(ValueError):
+    pass
+
+def misrouted(client_id, owner):
+    log.warning("↪️ Client belongs to another shard", extra={'client_id': client_id, 'shard': owner, 'sample': 'misrouted'})
+    return jsonify({"error": f"Client {client_id} belongs to shard {owner}", "shard": owner}), 421
+
+def report_self_metrics():
+    snapshot = self_metrics.snapshot()
+    # The log queue keeps its own count of records it had to drop
+    snapshot['counters'][('registration_server_log_records_dropped_total', ())] = dropped_records()
+    state.report_self_metrics(os.getpid(), snapshot)
+
+def _report_self_metrics_forever():
+    while True:
+        time.sleep(SELF_METRICS_FLUSH_INTERVAL)
+        try:
+            report_self_metrics()
+        except Exception as e:
+            log.error("❌ Failed to report self-metrics", extra={'error': str(e)})
+
+@app.before_request
+def start_request_timer():
+    global _reporter_pid
+    g.request_started = time.perf_counter()
+    # Started on first request so each forked worker gets its own reporter
+    if _reporter_pid != os.getpid():
+        _reporter_pid = os.getpid()
+        threading.Thread(target=_report_self_metrics_forever, name='self-metrics', daemon=True).start()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    self_metrics.observe('registration_server_request_duration_seconds',
+                         time.perf_counter() - g.request_started, route=route, method=request.method)
+    self_metrics.inc('registration_server_requests_total',
+                     route=route, method=request.method, status=str(response.status_code))
+    return response
+
+def read_push_payload():
+    """Read, decode and validate a push body, inflating Content-Encoding: gzip
+
+    Bodies over MAX_PUSH_BYTES (on the wire or inflated) are rejected before
+    any of it is parsed; a declared Content-Length is refused without reading.
+    """
+    if (request.content_length or 0) > MAX_PUSH_BYTES:
+        raise PayloadTooLarge(f"Body exceeds {MAX_PUSH_BYTES} bytes")
+    body = request.stream.read(MAX_PUSH_BYTES + 1)
+    if len(body) > MAX_PUSH_BYTES:
+        raise PayloadTooLarge(f"Body exceeds {MAX_PUSH_BYTES} bytes")
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(body, MAX_PUSH_BYTES + 1)
+        except zlib.error as e:
+            raise UndecodablePayload(f"Invalid gzip body: {e}") from None
+        if len(body) > MAX_PUSH_BYTES or inflater.unconsumed_tail:
+            raise PayloadTooLarge(f"Decompressed body exceeds {MAX_PUSH_BYTES} bytes")
+    return parse_push(body)
+
+def fold_samples(batch, stored):
+    """Rebuild each client's full samples from a push's samples (oldest first)
+
+    A keyframe (no "delta") is a full sample; a delta applies on top of the
+    previous sample when its "base" timestamp matches. A client whose first
+    sample is a delta is merged onto its stored sample from stored
+    ({client_id: (hostname, timestamp, metrics)}), and that timestamp is kept
+    as the chain's base so the state can check it is still current. Returns
+    (chains, client_ids whose deltas broke off and need a keyframe); each
+    chain lists its client's full samples as (timestamp, metrics), oldest first.
+    """
+    chains = {}
+    resync = set()
+    for metrics_data in batch:
+        client_id = metrics_data['client_id']
+        timestamp = metrics_data['timestamp']
+        chain = chains.get(client_id)
+        if not metrics_data.get('delta'):
+            if chain is None:
+                chain = chains[client_id] = {'base': None, 'samples': []}
+            chain['hostname'] = metrics_data['hostname']
+            metrics = dict(metrics_data['metrics'])
+            resync.discard(client_id)
+        else:
+            if chain is None and client_id not in resync:
+                current = stored.get(client_id)
+                if current is not None and current[1] == metrics_data['base']:
+                    chain = chains[client_id] = {'hostname': current[0], 'base': current[1], 'samples': [],
+                                                 'timestamp': current[1], 'metrics': current[2]}
+            if chain is None or chain['timestamp'] != metrics_data['base']:
+                resync.add(client_id)
+                continue
+            metrics = {key: value for key, value in chain['metrics'].items()
+                       if key not in metrics_data.get('removed', ())}
+            metrics.update(metrics_data['metrics'])
+            chain['hostname'] = metrics_data.get('hostname') or chain['hostname']
 
-# Ensure config exists on startup
-ensure_prometheus_config()
+        if chain['samples'] and chain['samples'][-1][0] == timestamp:
+            # The same sample twice (e.g. replayed); keep the later copy
+            chain['samples'].pop()
+        chain['samples'].append((timestamp, metrics))
+        chain['timestamp'] = timestamp
+        chain['metrics'] = metrics
+    return chains, resync
 
 @app.route('/register', methods=['POST'])
 def register_client():
     """Register a new client for monitoring"""
     try:
-        print("\n🔄 Starting client registration process...")
-        
         client_data = request.json
-        print(f"📥 Received client data: {client_data}")
+        log.debug("📥 Received client data", extra={'client_data': client_data})
         
         hostname = client_data['hostname']
         ip = client_data['ip']
         port = client_data.get('port', 8118)
         
-        print(f"🏷️  Client details: {hostname} ({ip}:{port})")
-        
-        # Read current config
-        print(f"📖 Reading Prometheus config from: {PROMETHEUS_CONFIG}")
-        with open(PROMETHEUS_CONFIG, 'r') as f:
-            config = yaml.safe_load(f)
-        
-        print(f"📋 Current scrape configs: {len(config['scrape_configs'])} jobs")
-        for job in config['scrape_configs']:
-            print(f"   - {job['job_name']}: {job['static_configs'][0]['targets']}")
-        
-        # Check if job already exists
-        job_name = f'client-{hostname}'
-        existing_job = None
-        for job in config['scrape_configs']:
-            if job['job_name'] == job_name:
-                existing_job = job
-                break
+        owner = foreign_shard(client_key(hostname, ip))
+        if owner:
+            return misrouted(client_key(hostname, ip), owner)
         
-        if existing_job:
-            # Update existing job
-            old_targets = existing_job['static_configs'][0]['targets']
-            existing_job['static_configs'][0]['targets'] = [f'{ip}:{port}']
-            print(f"🔄 Updated job '{job_name}': {old_targets} → [{ip}:{port}]")
+        # Update the registry (Prometheus picks it up via service discovery)
+        # and check client connectivity in the background
+        status, old_target, total = state.register_client(hostname, ip, port)
+        fields = {'hostname': hostname, 'target': f'{ip}:{port}', 'registered_clients': total}
+        if status == 'added':
+            log.info("➕ Client added", extra=fields)
+        elif status == 'updated':
+            log.info("🔄 Client target updated", extra={**fields, 'old_target': old_target})
         else:
-            # Add new job
-            new_job = {
-                'job_name': job_name,
-                'static_configs': [{'targets': [f'{ip}:{port}']}],
-                'scrape_interval': '15s'
-            }
-            config['scrape_configs'].append(new_job)
-            print(f"➕ Added new job '{job_name}' with target: {ip}:{port}")
-        
-        # Write updated config
-        print(f"💾 Writing updated config to: {PROMETHEUS_CONFIG}")
-        with open(PROMETHEUS_CONFIG, 'w') as f:
-            yaml.dump(config, f, default_flow_style=False)
-        
-        print(f"📋 Final scrape configs: {len(config['scrape_configs'])} jobs")
-        for job in config['scrape_configs']:
-            print(f"   - {job['job_name']}: {job['static_configs'][0]['targets']}")
-        
-        # Check client connectivity before reload
-        client_reachable = check_client_connectivity(ip, port)
-        
-        # Reload Prometheus
-        print("🔄 Reloading Prometheus configuration...")
-        reload_prometheus()
-        
-        # Final status
-        if client_reachable:
-            print(f"✅ Client {hostname} registration completed successfully\n")
-            return jsonify({"status": "success", "message": f"Client {hostname} registered and reachable"})
-        else:
-            print(f"⚠️ Client {hostname} registered but not reachable\n")
-            return jsonify({"status": "warning", "message": f"Client {hostname} registered but endpoint not reachable"})
+            # Clients re-register every few minutes; most of these are no-ops
+            log.info("✔️ Client re-registered unchanged", extra={**fields, 'sample': 'register_unchanged'})
+        return jsonify({
+            "status": "success",
+            "message": f"Client {hostname} registered",
+            "status_url": f"/registrations/{hostname}"
+        })
         
     except Exception as e:
-        print(f"❌ Registration error: {e}")
+        log.error("❌ Registration error", extra={'error': str(e)})
         return jsonify({"status": "error", "message": str(e)}), 500
 
-def reload_prometheus():
-    """Reload Prometheus configuration"""
-    try:
-        print("🔄 Sending reload request to Prometheus...")
-        import requests
-        response = requests.post('http://localhost:9090/-/reload', timeout=10)
-        print(f"📡 Prometheus reload response: {response.status_code}")
-        if response.status_code == 200:
-            print("✅ Prometheus configuration reloaded successfully")
-            # Verify targets after reload
-            verify_prometheus_targets()
-        else:
-            print(f"❌ Prometheus reload failed with status: {response.status_code}")
-            print(f"📄 Response text: {response.text}")
-    except Exception as e:
-        print(f"❌ Failed to reload Prometheus: {e}")
-        print("💡 Make sure Prometheus is running with --web.enable-lifecycle flag")
-
-def verify_prometheus_targets():
-    """Verify that targets are loaded in Prometheus"""
-    try:
-        print("🎯 Verifying Prometheus targets...")
-        import requests
-        import time
-        
-        # Wait a moment for reload to complete
-        time.sleep(2)
-        
-        response = requests.get('http://localhost:9090/api/v1/targets', timeout=10)
-        if response.status_code == 200:
-            targets_data = response.json()
-            active_targets = targets_data.get('data', {}).get('activeTargets', [])
-            
-            print(f"🎯 Found {len(active_targets)} active targets in Prometheus:")
-            for target in active_targets:
-                job = target.get('labels', {}).get('job', 'unknown')
-                instance = target.get('labels', {}).get('instance', 'unknown')
-                health = target.get('health', 'unknown')
-                print(f"   - Job: {job}, Instance: {instance}, Health: {health}")
-        else:
-            print(f"❌ Failed to get targets from Prometheus: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Failed to verify Prometheus targets: {e}")
+@app.route('/registrations', methods=['GET'])
+def registration_status():
+    """Results of background connectivity checks and Prometheus reloads"""
+    return jsonify(state.registration_status())
 
-def check_client_connectivity(ip, port):
-    """Check if client endpoint is reachable"""
-    try:
-        print(f"🔍 Checking client connectivity: {ip}:{port}")
-        import requests
-        response = requests.get(f'http://{ip}:{port}/metrics', timeout=5)
-        if response.status_code == 200:
-            print(f"✅ Client {ip}:{port} is reachable and serving metrics")
-            # Show first few lines of metrics
-            lines = response.text.split('\n')[:5]
-            print(f"📈 Sample metrics:")
-            for line in lines:
-                if line.strip():
-                    print(f"   {line}")
-            return True
-        else:
-            print(f"⚠️ Client {ip}:{port} responded with status: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Cannot reach client {ip}:{port}: {e}")
-        return False
+@app.route('/registrations/<hostname>', methods=['GET'])
+def client_registration_status(hostname):
+    """Connectivity check result for a single registered client"""
+    check = state.registration_status(hostname)
+    if check is None:
+        return jsonify({"error": f"Client {hostname} not registered"}), 404
+    return jsonify(check)
 
 @app.route('/clients', methods=['GET'])
 def list_clients():
-    """List registered clients with status"""
+    """List registered clients with cached reachability (?refresh=1 probes now)"""
     try:
-        print("📋 Listing registered clients...")
-        
-        # Get clients from config file
-        with open(PROMETHEUS_CONFIG, 'r') as f:
-            config = yaml.safe_load(f)
+        clients = state.list_clients(refresh=request.args.get('refresh') in ('1', 'true'))
         
-        clients = []
-        for job in config['scrape_configs']:
-            if job['job_name'].startswith('client-'):
-                for static_config in job['static_configs']:
-                    for target in static_config['targets']:
-                        ip, port = target.split(':')
-                        reachable = check_client_connectivity(ip, int(port))
-                        clients.append({
-                            'job_name': job['job_name'],
-                            'target': target,
-                            'reachable': reachable
-                        })
-        
-        print(f"📋 Found {len(clients)} registered clients")
+        log.debug("📋 Listed registered clients", extra={'clients': len(clients)})
         return jsonify({"clients": clients})
     except Exception as e:
-        print(f"❌ Error listing clients: {e}")
+        log.error("❌ Error listing clients", extra={'error': str(e)})
         return jsonify({"error": str(e)}), 500
 
+@app.route('/sd/targets', methods=['GET'])
+def sd_targets():
+    """Registered clients in Prometheus HTTP service discovery format"""
+    return state.sd_targets(), 200, {'Content-Type': 'application/json'}
+
 @app.route('/metrics', methods=['POST'])
 def receive_metrics():
-    """Receive pushed metrics from clients"""
+    """Receive pushed metrics from clients (single payload or {"batch": [...]}, optionally gzipped)"""
+    self_metrics.inc('registration_server_ingest_payloads_total')
+    self_metrics.inc('registration_server_ingest_bytes_total', request.content_length or 0)
     try:
-        metrics_data = request.json
-        client_id = metrics_data['client_id']
+        batch = read_push_payload()
+        self_metrics.inc('registration_server_ingest_samples_total', len(batch))
         
-        # Store metrics with timestamp
-        metrics_store[client_id] = {
-            'hostname': metrics_data['hostname'],
-            'timestamp': metrics_data['timestamp'],
-            'metrics': metrics_data['metrics'],
-            'last_seen': int(time.time())
-        }
+        for metrics_data in batch:
+            owner = foreign_shard(metrics_data['client_id'])
+            if owner:
+                self_metrics.inc('registration_server_ingest_failures_total', reason='misrouted')
+                return misrouted(metrics_data['client_id'], owner)
         
-        print(f"✅ Received metrics from {client_id}: CPU={metrics_data['metrics']['cpu_usage']}%")
-        return jsonify({"status": "success", "message": "Metrics received"})
+        # Rebuild every client's full samples; a client whose first sample is a delta
+        # needs its stored sample to merge onto
+        batch.sort(key=lambda sample: sample['timestamp'])
+        first = {}
+        for metrics_data in batch:
+            first.setdefault(metrics_data['client_id'], metrics_data)
+        delta_clients = [client_id for client_id, metrics_data in first.items() if metrics_data.get('delta')]
+        chains, resync = fold_samples(batch, state.latest_samples(delta_clients) if delta_clients else {})
+        
+        entries = []
+        for client_id, chain in chains.items():
+            if chain['base'] is not None:
+                self_metrics.inc('registration_server_ingest_deltas_total')
+            # Render the exposition lines here, in the worker, so scrapes only concatenate
+            samples = [(timestamp, metrics, render_client_samples(client_id, chain['hostname'], metrics))
+                       for timestamp, metrics in chain['samples']]
+            entries.append((client_id, chain['hostname'], chain['base'], samples))
+        
+        # Store metrics with timestamp; deltas that don't fit the stored sample need a keyframe
+        resync.update(state.store_metrics(entries))
+        if resync:
+            self_metrics.inc('registration_server_ingest_resyncs_total', len(resync))
+        
+        # One of these per push from every client, so only a sample is written
+        log.info("✅ Received metrics", extra={
+            'clients': len(entries), 'samples': len(batch), 'sample': 'metrics_received'
+        })
+        response = {"status": "success", "message": "Metrics received", "received": len(batch)}
+        if resync:
+            response["resync"] = sorted(resync)
+        return jsonify(response)
+    except PayloadTooLarge as e:
+        self_metrics.inc('registration_server_ingest_failures_total', reason='too_large')
+        log.warning("❌ Rejected metrics push", extra={'error': str(e)})
+        return jsonify({"error": str(e)}), 413
+    except SchemaError as e:
+        reason = 'parse' if isinstance(e, UndecodablePayload) else 'invalid'
+        self_metrics.inc('registration_server_ingest_failures_total', reason=reason)
+        log.warning("❌ Rejected metrics push", extra={'reason': reason, 'error': str(e), 'sample': 'push_rejected'})
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"❌ Error receiving metrics: {e}")
+        self_metrics.inc('registration_server_ingest_failures_total', reason='error')
+        log.error("❌ Error receiving metrics", extra={'error': str(e)})
         return jsonify({"error": str(e)}), 500
 
 @app.route('/metrics', methods=['GET'])
 def export_metrics():
-    """Export metrics in Prometheus format"""
+    """Export metrics in Prometheus text or OpenMetrics format from pre-rendered samples"""
     try:
-        prometheus_metrics = []
-        current_time = int(time.time())
+        openmetrics = ('application/openmetrics-text' in request.headers.get('Accept', '')
+                       or request.args.get('format') == 'openmetrics')
+        gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+        etag, body = state.exposition(openmetrics, gzipped, request.headers.get('If-None-Match'))
+        if body is None:
+            return '', 304, {'ETag': etag}
         
-        for client_id, data in metrics_store.items():
-            # Skip stale metrics (older than 60 seconds)
-            if current_time - data['last_seen'] > 60:
-                continue
-                
-            hostname = data['hostname']
-            metrics = data['metrics']
-            
-            # Format metrics in Prometheus format
-            prometheus_metrics.extend([
-                f'host_cpu_usage{{client_id="{client_id}",hostname="{hostname}"}} {metrics["cpu_usage"]}',
-                f'host_memory_usage{{client_id="{client_id}",hostname="{hostname}"}} {metrics["memory_usage"]}',
-                f'host_disk_usage{{client_id="{client_id}",hostname="{hostname}"}} {metrics["disk_usage"]}',
-                f'mysql_active_connections{{client_id="{client_id}",hostname="{hostname}"}} {metrics["mysql_connections"]}',
-                f'videos_processed_total{{client_id="{client_id}",hostname="{hostname}"}} {metrics["videos_processed"]}',
-                f'videos_error_total{{client_id="{client_id}",hostname="{hostname}"}} {metrics.get("videos_error", 0)}',
-                f'site_statics_total{{client_id="{client_id}",hostname="{hostname}"}} {metrics.get("site_statics", 0)}',
-                f'videos_not_processed_total{{client_id="{client_id}",hostname="{hostname}"}} {metrics.get("videos_not_processed", 0)}'
-            ])
-        
-        return '\n'.join(prometheus_metrics) + '\n', 200, {'Content-Type': 'text/plain'}
+        headers = {
+            'Content-Type': OPENMETRICS_CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE,
+            'ETag': etag,
+            'Vary': 'Accept, Accept-Encoding'
+        }
+        if gzipped:
+            headers['Content-Encoding'] = 'gzip'
+        return body, 200, headers
     except Exception as e:
-        print(f"❌ Error exporting metrics: {e}")
+        log.error("❌ Error exporting metrics", extra={'error': str(e)})
+        return f"# Error: {e}\n", 500, {'Content-Type': 'text/plain'}
+
+@app.route('/history/<client_id>', methods=['GET'])
+def client_history(client_id):
+    """A client's recent samples with min/max/avg/last/rate per metric
+
+    ?window=<seconds> (default 600), ?metric=<name> (repeatable, default all)
+    and ?points=0 to return only the aggregates.
+    """
+    try:
+        window = float(request.args.get('window', '600'))
+        if not window > 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "'window' must be a positive number of seconds"}), 400
+    try:
+        history = state.client_history(client_id, window, request.args.getlist('metric') or None,
+                                       request.args.get('points') not in ('0', 'false'))
+        if history is None:
+            return jsonify({"error": f"No history for client {client_id}"}), 404
+        return jsonify(history)
+    except Exception as e:
+        log.error("❌ Error querying client history", extra={'client_id': client_id, 'error': str(e)})
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/self/metrics', methods=['GET'])
+def export_self_metrics():
+    """The server's own request, ingest, store and reload metrics, summed over all workers"""
+    try:
+        # Include this worker's latest numbers rather than its last periodic report
+        report_self_metrics()
+        snapshot, gauges = state.self_metrics_snapshot()
+        return render_self_metrics(snapshot, gauges), 200, {'Content-Type': TEXT_CONTENT_TYPE}
+    except Exception as e:
+        log.error("❌ Error exporting self-metrics", extra={'error': str(e)})
         return f"# Error: {e}\n", 500, {'Content-Type': 'text/plain'}
 
 @app.route('/status', methods=['GET'])
 def system_status():
     """Get system status including active clients"""
     try:
-        print("🔍 Checking system status...")
-        
         current_time = int(time.time())
         active_clients = []
+        metrics_store = state.metrics_snapshot()
         
         for client_id, data in metrics_store.items():
             age = current_time - data['last_seen']
@@ -279,18 +338,21 @@ def system_status():
         status = {
             'total_clients': len(metrics_store),
             'active_clients': len([c for c in active_clients if c['active']]),
+            'store': state.store_stats(),
             'clients': active_clients
         }
+        if shard_ring:
+            status['shard'] = {'url': SHARD_URL, 'shards': SHARDS}
         
-        print(f"📈 System status: {len(active_clients)} clients")
+        log.debug("📈 System status", extra={'clients': len(active_clients)})
         return jsonify(status)
     except Exception as e:
-        print(f"❌ Error getting system status: {e}")
+        log.error("❌ Error getting system status", extra={'error': str(e)})
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    print("🚀 Starting registration server on port 5001")
-    print(f"📁 Prometheus config file: {PROMETHEUS_CONFIG}")
-    print(f"📊 Prometheus should be accessible at: http://localhost:9090")
-    print(f"🔧 Registration API available at: http://0.0.0.0:5001")
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # Development server; production runs under gunicorn (see gunicorn.conf.py and start.sh)
+    log.info("🚀 Starting registration server on port 5001", extra={
+        'prometheus_config': PROMETHEUS_CONFIG, 'prometheus_url': PROMETHEUS_URL
+    })
+    app.run(host='0.0.0.0', port=5001, debug=os.getenv('FLASK_DEBUG') == '1', use_reloader=False)
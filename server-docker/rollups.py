@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import heapq
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from exposition import KNOWN_METRICS, STALE_AFTER, escape_label_value, format_value
+
+# Payload keys rolled up across the fleet -> aggregates exported besides the top-N
+ROLLUP_METRICS = {
+    'cpu_usage': ('sum', 'avg', 'count'),
+    'memory_usage': ('sum', 'avg', 'count'),
+    'disk_usage': ('sum', 'avg', 'count'),
+    'mysql_connections': ('sum',),
+    'videos_processed': ('sum',),
+    'videos_error': ('sum',),
+    'site_statics': ('sum',),
+    'videos_not_processed': ('sum',),
+}
+
+_AGGREGATE_HELP = {
+    'sum': 'summed over active clients',
+    'avg': 'averaged over active clients',
+    'count': 'active clients reporting it',
+}
+
+
+def rollup_values(metrics):
+    """The rolled-up metrics of one sample as floats; missing and non-numeric values are left out"""
+    values = {}
+    for key in ROLLUP_METRICS:
+        value = metrics.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            values[key] = float(value)
+    return values
+
+
+class FleetRollups:
+    """Fleet-wide aggregates of the built-in metrics, kept up to date as pushes arrive
+
+    Each push replaces the client's previous contribution to the running sums,
+    so the active client count, totals and averages cost nothing to export.
+    A client stops counting once its last push is older than stale_after, the
+    same rule /metrics applies to its samples.
+    """
+
+    def __init__(self, stale_after=STALE_AFTER, top_n=5):
+        self.stale_after = stale_after
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        # client_id -> (hostname, values, last_seen), oldest push first
+        self._active = OrderedDict()
+        self._sums = dict.fromkeys(ROLLUP_METRICS, 0.0)
+        self._counts = dict.fromkeys(ROLLUP_METRICS, 0)
+
+    def update(self, client_id, hostname, metrics, last_seen):
+        values = rollup_values(metrics)
+        with self._lock:
+            self._discard(client_id)
+            self._active[client_id] = (hostname, values, last_seen)
+            for key, value in values.items():
+                self._sums[key] += value
+                self._counts[key] += 1
+
+    def remove(self, client_ids):
+        """Forget clients evicted from the store"""
+        with self._lock:
+            for client_id in client_ids:
+                self._discard(client_id)
+
+    def _discard(self, client_id):
+        previous = self._active.pop(client_id, None)
+        if previous is None:
+            return
+        for key, value in previous[1].items():
+            self._counts[key] -= 1
+            # Reset rather than accumulate float error once nobody reports the metric
+            self._sums[key] = self._sums[key] - value if self._counts[key] else 0.0
+
+    def _expire(self, now):
+        while self._active:
+            client_id, (_, _, last_seen) = next(iter(self._active.items()))
+            if now - last_seen <= self.stale_after:
+                break
+            self._discard(client_id)
+
+    def render(self):
+        """Rollup families as exposition text"""
+        with self._lock:
+            self._expire(int(time.time()))
+            active = len(self._active)
+            sums = dict(self._sums)
+            counts = dict(self._counts)
+            top = {}
+            if self.top_n > 0:
+                for key in ROLLUP_METRICS:
+                    top[key] = heapq.nlargest(
+                        self.top_n,
+                        ((values[key], client_id, hostname)
+                         for client_id, (hostname, values, _) in self._active.items() if key in values)
+                    )
+
+        parts = [
+            '# HELP fleet_clients_active Clients that pushed within the staleness window\n'
+            '# TYPE fleet_clients_active gauge\n'
+            f'fleet_clients_active {active}\n'
+        ]
+        for key, aggregates in ROLLUP_METRICS.items():
+            family, _, help_text = KNOWN_METRICS[key]
+            for aggregate in aggregates:
+                name = f'fleet_{family}_{aggregate}'
+                if not counts[key]:
+                    # No active client reports it; a total or average of nothing is left out
+                    continue
+                if aggregate == 'count':
+                    # Lets queries weight this average against other sources, e.g. scraped hosts
+                    value = counts[key]
+                else:
+                    value = sums[key] if aggregate == 'sum' else sums[key] / counts[key]
+                parts.append(f'# HELP {name} {help_text}, {_AGGREGATE_HELP[aggregate]}\n'
+                             f'# TYPE {name} gauge\n{name} {format_value(value)}\n')
+            if top.get(key):
+                name = f'fleet_top_{family}'
+                parts.append(f'# HELP {name} {help_text}, {self.top_n} highest clients\n# TYPE {name} gauge\n')
+                for value, client_id, hostname in top[key]:
+                    parts.append(f'{name}{{client_id="{escape_label_value(client_id)}",'
+                                 f'hostname="{escape_label_value(hostname)}"}} {format_value(value)}\n')
+        return ''.join(parts)
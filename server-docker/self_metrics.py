@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import threading
+
+from exposition import escape_label_value, format_value
+
+# Upper bounds (seconds) of the request and reload duration histograms
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Self-metric families -> (type, help)
+SELF_FAMILIES = {
+    'registration_server_requests_total': ('counter', 'HTTP requests handled, by route, method and status'),
+    'registration_server_request_duration_seconds': ('histogram', 'HTTP request handling time, by route and method'),
+    'registration_server_ingest_payloads_total': ('counter', 'Metrics push requests received'),
+    'registration_server_ingest_samples_total': ('counter', 'Samples received in metrics pushes'),
+    'registration_server_ingest_bytes_total': ('counter', 'Metrics push body bytes received, as sent on the wire'),
+    'registration_server_ingest_failures_total': ('counter', 'Metrics pushes rejected, by reason'),
+    'registration_server_ingest_deltas_total': ('counter', 'Delta samples merged onto stored client state'),
+    'registration_server_ingest_resyncs_total': ('counter', 'Clients asked to send a full sample after an unusable delta'),
+    'registration_server_prometheus_reloads_total': ('counter', 'Prometheus config reloads, by result'),
+    'registration_server_prometheus_reload_duration_seconds': ('histogram', 'Time taken by Prometheus reload requests'),
+    'registration_server_store_clients': ('gauge', 'Clients in the pushed-metrics store'),
+    'registration_server_store_max_clients': ('gauge', 'Pushed-metrics store capacity'),
+    'registration_server_store_evictions_total': ('counter', 'Clients evicted from the pushed-metrics store, by reason'),
+    'registration_server_registered_clients': ('gauge', 'Clients in the registry'),
+    'registration_server_log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full'),
+}
+
+
+class SelfMetrics:
+    """Counters and histograms of one process; snapshots from all workers are summed when scraped
+
+    Keys are (name, sorted label items) so snapshots pickle as plain data.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # Per-bucket counts (the last one is +Inf), then sum and count
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(DURATION_BUCKETS) + 3)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    break
+            else:
+                i = len(DURATION_BUCKETS)
+            histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': {key: list(histogram) for key, histogram in self._histograms.items()}
+            }
+
+
+def merge_snapshots(snapshots):
+    """Sum SelfMetrics snapshots from several processes"""
+    merged = {'counters': {}, 'histograms': {}}
+    for snapshot in snapshots:
+        for key, value in snapshot['counters'].items():
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        for key, histogram in snapshot['histograms'].items():
+            current = merged['histograms'].get(key)
+            merged['histograms'][key] = histogram if current is None else [a + b for a, b in zip(current, histogram)]
+    return merged
+
+
+def _labels(items, extra=''):
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in items]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render_self_metrics(snapshot, gauges):
+    """Prometheus text for a merged snapshot plus gauges given as {(name, label items): value}"""
+    families = {}
+    for (name, items), value in list(snapshot['counters'].items()) + list(gauges.items()):
+        families.setdefault(name, []).append(f'{name}{_labels(items)} {format_value(value)}\n')
+    for (name, items), histogram in snapshot['histograms'].items():
+        lines = families.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(list(DURATION_BUCKETS) + ['+Inf'], histogram):
+            cumulative += count
+            le = bound if isinstance(bound, str) else format_value(float(bound))
+            le_label = f'le="{le}"'
+            lines.append(f'{name}_bucket{_labels(items, le_label)} {cumulative}\n')
+        lines.append(f'{name}_sum{_labels(items)} {format_value(float(histogram[-2]))}\n')
+        lines.append(f'{name}_count{_labels(items)} {histogram[-1]}\n')
+
+    parts = []
+    for name in sorted(families):
+        metric_type, help_text = SELF_FAMILIES.get(name, ('untyped', name))
+        parts.append(f'# HELP {name} {help_text}\n# TYPE {name} {metric_type}\n')
+        parts.extend(sorted(families[name]) if metric_type != 'histogram' else families[name])
+    return ''.join(parts)
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+
+import requests
+import yaml
+
+from client_registry import ClientRegistry, DebouncedWriter, clients_job, migrate_prometheus_config
+from client_store import ClientRecord, ClientStore
+from exposition import ExpositionCache, render_client_samples
+from history import SampleHistory
+from log_config import dropped_records, setup_logging
+from persistence import StatePersistence
+from prober import ReachabilityProber
+from rollups import FleetRollups
+from self_metrics import SelfMetrics, merge_snapshots
+from sharding import HashRing, client_key, parse_shards
+
+log = logging.getLogger(__name__)
+
+PROMETHEUS_CONFIG = os.getenv('PROMETHEUS_CONFIG', '/app/central-prometheus.yml')
+PROMETHEUS_URL = os.getenv('PROMETHEUS_URL', 'http://localhost:9090')
+# Registered clients are handed to Prometheus through HTTP service discovery
+SD_TARGETS_URL = os.getenv('SD_TARGETS_URL', 'http://localhost:5001/sd/targets')
+# Optional file_sd JSON to use instead of polling /sd/targets
+FILE_SD_PATH = os.getenv('FILE_SD_PATH', '')
+# Registrations within this many seconds share one file_sd write
+SD_FLUSH_INTERVAL = float(os.getenv('SD_FLUSH_INTERVAL', '2'))
+
+# Threads for connectivity checks and reload verification, kept off request handlers
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '8'))
+# Scheduled TCP reachability sweep over all registered clients, served by /clients
+PROBE_INTERVAL = float(os.getenv('PROBE_INTERVAL', '60'))
+PROBE_TIMEOUT = float(os.getenv('PROBE_TIMEOUT', '2'))
+PROBE_CONCURRENCY = int(os.getenv('PROBE_CONCURRENCY', '32'))
+
+# Pushed-metrics store bounds: clients silent for CLIENT_TTL seconds are swept,
+# and past MAX_CLIENTS the least recently pushed client is evicted
+CLIENT_TTL = int(os.getenv('CLIENT_TTL', '600'))
+MAX_CLIENTS = int(os.getenv('MAX_CLIENTS', '10000'))
+STORE_SWEEP_INTERVAL = float(os.getenv('STORE_SWEEP_INTERVAL', '30'))
+
+# Registry and latest samples survive restarts through snapshots (and a registration WAL)
+# in STATE_DIR; empty disables persistence
+STATE_DIR = os.getenv('STATE_DIR', '/app/state-data')
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', '30'))
+
+# Recent samples kept per client for GET /history (40 = 10 minutes at the default 15s interval);
+# 0 disables. Each client keeps at most HISTORY_MAX_SERIES metrics
+HISTORY_SIZE = int(os.getenv('HISTORY_SIZE', '40'))
+HISTORY_MAX_SERIES = int(os.getenv('HISTORY_MAX_SERIES', '100'))
+
+# Samples older than a client's latest (replayed or batched) are exported with their own
+# timestamps for BACKFILL_FOR seconds; keep BACKFILL_MAX_AGE within Prometheus'
+# out_of_order_time_window, which it needs to accept them
+BACKFILL_FOR = int(os.getenv('BACKFILL_FOR', '60'))
+BACKFILL_MAX_AGE = int(os.getenv('BACKFILL_MAX_AGE', '3600'))
+BACKFILL_MAX_SAMPLES = int(os.getenv('BACKFILL_MAX_SAMPLES', '50000'))
+
+# Highest clients exported per rolled-up metric as fleet_top_* series; 0 disables them
+ROLLUP_TOP_N = int(os.getenv('ROLLUP_TOP_N', '5'))
+
+# Shard mode: SHARDS lists every server's base URL (the clients' CENTRAL_SHARDS) and SHARD_URL
+# is this server's entry; each shard only accepts the clients the hash ring assigns it
+SHARDS = parse_shards(os.getenv('SHARDS', ''))
+SHARD_URL = os.getenv('SHARD_URL', '').rstrip('/')
+shard_ring = HashRing(SHARDS) if SHARDS else None
+if shard_ring and SHARD_URL not in SHARDS:
+    raise ValueError(f"SHARD_URL {SHARD_URL!r} is not one of SHARDS {SHARDS}")
+
+
+def foreign_shard(client_id):
+    """The shard owning client_id when it isn't this one, else None"""
+    if shard_ring is None:
+        return None
+    owner = shard_ring.shard_for(client_id)
+    return owner if owner != SHARD_URL else None
+
+
+def foreign_target(hostname, target):
+    """Whether a registered ip:port target belongs to another shard"""
+    return foreign_shard(client_key(hostname, target.rsplit(':', 1)[0])) is not None
+
+
+def ensure_prometheus_config():
+    """Create Prometheus config if it doesn't exist"""
+    if not os.path.exists(PROMETHEUS_CONFIG):
+        default_config = {
+            'global': {
+                'evaluation_interval': '15s',
+                'scrape_interval': '15s'
+            },
+            # Lets Prometheus take backfilled pushed samples older than the latest ones
+            'storage': {'tsdb': {'out_of_order_time_window': '1h'}},
+            'scrape_configs': [
+                {
+                    'job_name': 'prometheus',
+                    'static_configs': [{'targets': ['localhost:9090']}]
+                }
+            ]
+        }
+        os.makedirs(os.path.dirname(PROMETHEUS_CONFIG), exist_ok=True)
+        with open(PROMETHEUS_CONFIG, 'w') as f:
+            yaml.dump(default_config, f, default_flow_style=False)
+        log.info("✅ Created default Prometheus config", extra={'path': PROMETHEUS_CONFIG})
+
+
+class ServerState:
+    """Client registry, pushed metrics and background work shared by all request handlers
+
+    Every public method returns plain data so the object can be served to
+    gunicorn workers through a multiprocessing manager.
+    """
+
+    def __init__(self):
+        # Client registry, served to Prometheus by /sd/targets and optionally a file_sd file
+        self.registry = ClientRegistry()
+        self.sd_writer = None
+
+        # In-memory storage for pushed metrics, plus fleet rollups exported alongside them
+        self.rollups = FleetRollups(top_n=ROLLUP_TOP_N)
+        self.exposition_cache = ExpositionCache(extra=self.rollups.render, backfill_for=BACKFILL_FOR,
+                                                max_backfill=BACKFILL_MAX_SAMPLES)
+        self.history = SampleHistory(HISTORY_SIZE, HISTORY_MAX_SERIES)
+        self.client_store = ClientStore(
+            ttl=CLIENT_TTL, max_clients=MAX_CLIENTS, sweep_interval=STORE_SWEEP_INTERVAL,
+            on_evict=self._evict_clients
+        )
+
+        self.persistence = StatePersistence(STATE_DIR, self._capture_state, SNAPSHOT_INTERVAL) if STATE_DIR else None
+
+        self.background = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='background')
+        # Results of background work, exposed through /registrations
+        self._status_lock = threading.Lock()
+        self._registration_checks = {}
+        self._prometheus_status = {}
+
+        # Metrics of this process (reloads); workers report theirs through report_self_metrics
+        self.self_metrics = SelfMetrics()
+        self._worker_metrics = {}
+
+        self.prober = ReachabilityProber(
+            lambda: [target for _, target in self.registry.clients()],
+            interval=PROBE_INTERVAL, timeout=PROBE_TIMEOUT, concurrency=PROBE_CONCURRENCY
+        )
+
+    def _evict_clients(self, client_ids):
+        self.exposition_cache.remove(client_ids)
+        self.rollups.remove(client_ids)
+        self.history.remove(client_ids)
+
+    def start(self):
+        """Prepare the Prometheus config and start background threads"""
+        ensure_prometheus_config()
+        if self.persistence:
+            self.restore()
+            self.persistence.start()
+        self.setup_service_discovery()
+        self.prober.start()
+        self.client_store.start()
+
+    def _capture_state(self):
+        return {
+            'registry': dict(self.registry.clients()),
+            'clients': self.client_store.snapshot()
+        }
+
+    def restore(self):
+        """Reload the registry and latest samples from the last snapshot and the WAL"""
+        started = time.perf_counter()
+        snapshot, registrations = self.persistence.load()
+        # Clients the shard ring now assigns elsewhere (e.g. after adding a shard) are left behind
+        foreign = 0
+        for hostname, target in snapshot.get('registry', {}).items():
+            if foreign_target(hostname, target):
+                foreign += 1
+                continue
+            ip, port = target.rsplit(':', 1)
+            self.registry.upsert(hostname, ip, int(port))
+        for hostname, ip, port in registrations:
+            if foreign_target(hostname, f'{ip}:{port}'):
+                foreign += 1
+                continue
+            self.registry.upsert(hostname, ip, port)
+
+        # Records were saved in push order, which the store's LRU order relies on
+        for client_id, record in snapshot.get('clients', {}).items():
+            if foreign_shard(client_id):
+                foreign += 1
+                continue
+            self.client_store.put(client_id, ClientRecord.from_dict(record))
+            samples = render_client_samples(client_id, record['hostname'], record['metrics'])
+            self.exposition_cache.update(client_id, samples, record['last_seen'])
+            self.rollups.update(client_id, record['hostname'], record['metrics'], record['last_seen'])
+
+        if snapshot or registrations:
+            log.info("📦 Restored state", extra={
+                'registered_clients': len(self.registry), 'pushing_clients': len(self.client_store),
+                'wal_entries': len(registrations), 'foreign_dropped': foreign, 'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            })
+
+    def save_snapshot(self):
+        """Write a snapshot now (e.g. at shutdown)"""
+        if self.persistence:
+            self.persistence.save()
+
+    def setup_service_discovery(self):
+        """Point Prometheus at the registry with a single 'clients' job"""
+        job = clients_job(SD_TARGETS_URL, FILE_SD_PATH or None)
+        changed, legacy_targets = migrate_prometheus_config(PROMETHEUS_CONFIG, job)
+
+        # Carry over clients registered as static jobs by older versions, if this shard owns them
+        migrated = {hostname: target for hostname, target in legacy_targets.items()
+                    if not foreign_target(hostname, target)}
+        for hostname, target in migrated.items():
+            ip, port = target.rsplit(':', 1)
+            self.registry.upsert(hostname, ip, int(port))
+        if migrated:
+            log.info("📦 Migrated static client jobs into the registry", extra={'clients': len(migrated)})
+
+        if FILE_SD_PATH:
+            self.sd_writer = DebouncedWriter(FILE_SD_PATH, self.registry.targets_json, window=SD_FLUSH_INTERVAL)
+            self.sd_writer.flush()
+            self.sd_writer.start()
+            log.info("📁 Writing file_sd targets", extra={'path': FILE_SD_PATH})
+
+        if changed:
+            log.info("🔧 Prometheus config now uses the 'clients' service-discovery job")
+            self.reload_prometheus()
+
+    def reload_prometheus(self):
+        """Reload Prometheus configuration"""
+        started = time.perf_counter()
+        try:
+            log.debug("🔄 Sending reload request to Prometheus")
+            response = requests.post(f'{PROMETHEUS_URL}/-/reload', timeout=10)
+            log.debug("📡 Prometheus reload response", extra={'status': response.status_code})
+            self._record_reload(started, 'ok' if response.status_code == 200 else 'failed')
+            with self._status_lock:
+                self._prometheus_status.update(last_reload=int(time.time()), reload_ok=response.status_code == 200)
+            if response.status_code == 200:
+                log.info("✅ Prometheus configuration reloaded", extra={'duration_ms': round((time.perf_counter() - started) * 1000, 1)})
+                # Verify targets after reload
+                self.background.submit(self._verify_prometheus_targets)
+            else:
+                log.error("❌ Prometheus reload failed", extra={'status': response.status_code, 'response': response.text[:500]})
+        except Exception as e:
+            self._record_reload(started, 'error')
+            with self._status_lock:
+                self._prometheus_status.update(last_reload=int(time.time()), reload_ok=False)
+            log.error("❌ Failed to reload Prometheus (is it running with --web.enable-lifecycle?)", extra={'error': str(e)})
+
+    def _record_reload(self, started, result):
+        self.self_metrics.observe('registration_server_prometheus_reload_duration_seconds', time.perf_counter() - started)
+        self.self_metrics.inc('registration_server_prometheus_reloads_total', result=result)
+
+    def _verify_prometheus_targets(self):
+        """Verify that targets are loaded in Prometheus"""
+        try:
+            log.debug("🎯 Verifying Prometheus targets")
+
+            # Wait a moment for reload to complete
+            time.sleep(2)
+
+            response = requests.get(f'{PROMETHEUS_URL}/api/v1/targets', timeout=10)
+            if response.status_code == 200:
+                targets_data = response.json()
+                active_targets = targets_data.get('data', {}).get('activeTargets', [])
+
+                healthy_targets = len([t for t in active_targets if t.get('health') == 'up'])
+                with self._status_lock:
+                    self._prometheus_status.update(
+                        verified_at=int(time.time()),
+                        active_targets=len(active_targets),
+                        healthy_targets=healthy_targets
+                    )
+
+                log.info("🎯 Prometheus targets verified", extra={
+                    'active_targets': len(active_targets), 'healthy_targets': healthy_targets
+                })
+                for target in active_targets:
+                    job = target.get('labels', {}).get('job', 'unknown')
+                    instance = target.get('labels', {}).get('instance', 'unknown')
+                    health = target.get('health', 'unknown')
+                    log.debug("🎯 Prometheus target", extra={'job': job, 'instance': instance, 'health': health})
+            else:
+                log.error("❌ Failed to get targets from Prometheus", extra={'status': response.status_code})
+        except Exception as e:
+            log.error("❌ Failed to verify Prometheus targets", extra={'error': str(e)})
+
+    # Registration
+
+    def register_client(self, hostname, ip, port):
+        """Upsert a client and queue its connectivity check; returns (status, old_target, total)"""
+        status, old_target = self.registry.upsert(hostname, ip, port)
+        if status != 'unchanged':
+            if self.persistence:
+                self.persistence.log_registration(hostname, ip, port)
+            if self.sd_writer:
+                self.sd_writer.mark_dirty()
+        self._queue_connectivity_check(hostname, ip, port)
+        return status, old_target, len(self.registry)
+
+    def _queue_connectivity_check(self, hostname, ip, port):
+        """Schedule a connectivity check unless one is already pending for this target"""
+        target = f'{ip}:{port}'
+        with self._status_lock:
+            current = self._registration_checks.get(hostname)
+            if current and current['target'] == target and current['state'] == 'pending':
+                return
+            self._registration_checks[hostname] = {
+                'target': target,
+                'state': 'pending',
+                'registered_at': int(time.time()),
+                'checked_at': None
+            }
+        self.background.submit(self._run_connectivity_check, hostname, ip, port)
+
+    def _run_connectivity_check(self, hostname, ip, port):
+        """Background task recording whether a registered client is reachable"""
+        result = self.prober.probe(f'{ip}:{port}')
+        if result['reachable']:
+            log.info("✅ Client reachable", extra={'hostname': hostname, 'target': f'{ip}:{port}'})
+        else:
+            log.warning("❌ Cannot reach client", extra={'hostname': hostname, 'target': f'{ip}:{port}', 'error': result['error']})
+        with self._status_lock:
+            current = self._registration_checks.get(hostname)
+            # Drop the result if the client re-registered with a new target meanwhile
+            if current and current['target'] == f'{ip}:{port}':
+                current['state'] = 'reachable' if result['reachable'] else 'unreachable'
+                current['checked_at'] = result['checked_at']
+
+    def registration_status(self, hostname=None):
+        """Background check results for one client (None if unknown) or for all plus Prometheus"""
+        with self._status_lock:
+            if hostname is not None:
+                check = self._registration_checks.get(hostname)
+                return dict(check) if check else None
+            return {
+                'clients': {name: dict(check) for name, check in self._registration_checks.items()},
+                'prometheus': dict(self._prometheus_status)
+            }
+
+    def list_clients(self, refresh=False):
+        """Registered clients with cached reachability, optionally probing them first"""
+        if refresh:
+            self.prober.probe_all()
+        results = self.prober.results()
+
+        clients = []
+        for hostname, target in self.registry.clients():
+            # Clients registered since the last sweep have no result yet
+            result = results.get(target, {})
+            clients.append({
+                'hostname': hostname,
+                'target': target,
+                'reachable': result.get('reachable'),
+                'latency_ms': result.get('latency_ms'),
+                'checked_at': result.get('checked_at')
+            })
+        return clients
+
+    def sd_targets(self):
+        return self.registry.targets_json()
+
+    # Pushed metrics
+
+    def store_metrics(self, entries):
+        """Store clients' samples along with their pre-rendered exposition lines
+
+        entries is a list of (client_id, hostname, base, samples), samples
+        being [(timestamp, metrics, rendered)] oldest first, so a whole batched
+        push costs one call from the worker. The newest sample becomes the
+        client's latest unless a newer one is stored; the others are
+        backfilled. Entries with a base were merged by the worker onto the
+        stored sample taken at that timestamp and are only kept if it is still
+        the current one. Returns the client_ids whose deltas no longer match
+        and need to send a full sample.
+        """
+        last_seen = int(time.time())
+        resync = []
+        for client_id, hostname, base, samples in entries:
+            current = self.client_store.get(client_id)
+            if base is not None and (current is None or current.timestamp != base):
+                # Another push for this client landed after the worker read the stored sample
+                resync.append(client_id)
+                continue
+            # Every sample goes into the history, wherever it falls in the client's timeline
+            for ts, sample_metrics, _ in samples:
+                self.history.append(client_id, ts, sample_metrics)
+            timestamp, metrics, rendered = samples[-1]
+            older = samples[:-1]
+            # Samples replayed from a client's spool must not replace a newer live one
+            if current is None or current.timestamp <= timestamp:
+                self.client_store.put(client_id, ClientRecord(hostname, timestamp, metrics, last_seen))
+                self.exposition_cache.update(client_id, rendered, last_seen)
+                self.rollups.update(client_id, hostname, metrics, last_seen)
+            else:
+                older = samples
+            # Prometheus rejects samples further back than its out-of-order window
+            backfill = [(ts, lines) for ts, _, lines in older
+                        if ts >= last_seen - BACKFILL_MAX_AGE and (current is None or ts != current.timestamp)]
+            if backfill:
+                self.exposition_cache.backfill(client_id, backfill, last_seen)
+        return resync
+
+    def latest_samples(self, client_ids):
+        """{client_id: (hostname, timestamp, metrics)} of the stored samples deltas are merged onto"""
+        latest = {}
+        for client_id in client_ids:
+            record = self.client_store.get(client_id)
+            if record is not None:
+                latest[client_id] = (record.hostname, record.timestamp, record.metrics)
+        return latest
+
+    def exposition(self, openmetrics=False, gzipped=False, if_none_match=None):
+        """Scrape body for GET /metrics as (etag, body), body None if unchanged"""
+        return self.exposition_cache.render(openmetrics, gzipped, if_none_match)
+
+    def metrics_snapshot(self):
+        """Copy of the pushed-metrics store keyed by client_id"""
+        return self.client_store.snapshot()
+
+    def client_history(self, client_id, window, names=None, points=True):
+        """A client's samples from the last window seconds with min/max/avg/last/rate per metric"""
+        record = self.client_store.get(client_id)
+        history = self.history.query(client_id, time.time() - window, names, points)
+        if record is None or history is None:
+            return None
+        return {'client_id': client_id, 'hostname': record.hostname, 'window_seconds': window, **history}
+
+    def store_stats(self):
+        """Store size, bounds and eviction counters"""
+        return self.client_store.stats()
+
+    # Self-metrics
+
+    def report_self_metrics(self, worker_id, snapshot):
+        """Record a worker's cumulative SelfMetrics snapshot (replacing its previous one)"""
+        with self._status_lock:
+            self._worker_metrics[worker_id] = snapshot
+
+    def self_metrics_snapshot(self):
+        """(merged counters/histograms of all workers and this process, gauges)"""
+        with self._status_lock:
+            # Exited workers' snapshots stay in, so counters never go backwards
+            snapshots = list(self._worker_metrics.values())
+            in_process = os.getpid() in self._worker_metrics
+        own = self.self_metrics.snapshot()
+        # Without gunicorn the app runs in this process and has already reported this log queue
+        if not in_process:
+            own['counters'][('registration_server_log_records_dropped_total', ())] = dropped_records()
+        merged = merge_snapshots(snapshots + [own])
+
+        stats = self.client_store.stats()
+        gauges = {
+            ('registration_server_store_clients', ()): stats['clients'],
+            ('registration_server_store_max_clients', ()): stats['max_clients'],
+            ('registration_server_registered_clients', ()): len(self.registry),
+        }
+        for reason, count in stats['evictions'].items():
+            gauges[('registration_server_store_evictions_total', (('reason', reason),))] = count
+        return merged, gauges
+
+
+class StateManager(BaseManager):
+    pass
+
+
+_state = None
+
+
+def _serve_state():
+    """Initializer run inside the manager process: build the single shared state"""
+    global _state
+    setup_logging('registration-state')
+    _state = ServerState()
+    _state.start()
+
+
+def _get_state():
+    return _state
+
+
+StateManager.register('get_state', callable=_get_state)
+
+
+def start_state_server(address, authkey):
+    """Start the process hosting ServerState for gunicorn workers to connect to"""
+    if os.path.exists(address):
+        os.unlink(address)
+    manager = StateManager(address=address, authkey=authkey)
+    manager.start(initializer=_serve_state)
+    return manager
+
+
+def get_state():
+    """Shared state proxy when running under gunicorn, otherwise an in-process instance"""
+    # Set by the gunicorn master after this module was imported, so read it at call time
+    address = os.getenv('STATE_ADDRESS')
+    if address:
+        manager = StateManager(address=address, authkey=os.environ['STATE_AUTHKEY'].encode())
+        manager.connect()
+        return manager.get_state()
+
+    state = ServerState()
+    state.start()
+    atexit.register(state.save_snapshot)
+    return state
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Shared by the server and the clients; server-docker/ and client-docker/ each ship a copy
+import bisect
+import hashlib
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+def parse_shards(value):
+    """Shard base URLs from a comma-separated list"""
+    return [shard.strip().rstrip('/') for shard in (value or '').split(',') if shard.strip()]
+
+
+def client_key(hostname, ip):
+    """Routing key of a client; the same string the clients use as client_id"""
+    return f'{hostname}-{ip}'
+
+
+def _hash(value):
+    # Stable across processes and machines, unlike hash()
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring assigning client IDs to shards
+
+    Each shard owns `replicas` points on the ring, so adding or removing a
+    shard only moves the clients in its slices (about 1/N of them). Clients
+    and servers build the ring from the same shard list and agree on owners.
+    """
+
+    def __init__(self, shards, replicas=100):
+        if not shards:
+            raise ValueError("A hash ring needs at least one shard")
+        self.shards = list(shards)
+        points = sorted((_hash(f'{shard}#{i}'), shard) for shard in self.shards for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardRouter:
+    """Picks the server a client talks to: CENTRAL_HOST, or its shard when a shard list is given
+
+    A server answering 421 names the shard that owns the client; that answer
+    is followed until the client's ID changes, which covers clients whose
+    shard list is out of date while shards are being added.
+    """
+
+    def __init__(self, central_host, shards=None):
+        self.central_host = central_host
+        self.ring = HashRing(shards) if shards else None
+        self._lock = threading.Lock()
+        self._redirects = {}
+
+    def host_for(self, client_id):
+        if self.ring is None:
+            return self.central_host
+        with self._lock:
+            redirected = self._redirects.get(client_id)
+        return redirected or self.ring.shard_for(client_id)
+
+    def redirect(self, client_id, shard):
+        """Remember the shard a server said owns client_id"""
+        if not shard:
+            return
+        with self._lock:
+            # Only the current client ID matters; a new public IP starts over
+            self._redirects = {client_id: shard.rstrip('/')}
+        log.warning("↪️ Server redirected client to another shard", extra={'client_id': client_id, 'shard': shard})
@@ -3,7 +3,7 @@
 echo "🚀 Starting Centralized Monitoring Server..."
 
 # Create necessary directories
-mkdir -p /app/prometheus-data /app/grafana-data
+mkdir -p /app/prometheus-data /app/grafana-data /app/state-data
 
 # Start Prometheus in background
 echo "📊 Starting Prometheus..."
@@ -71,7 +71,11 @@ cd /opt/grafana
 # Wait for Grafana to start
 sleep 10
 
-# Start Flask registration server
+# Start registration server (SERVER_MODE=dev runs the Flask development server)
 echo "🔧 Starting Registration Server..."
 cd /app
-python3 registration-server.py
\ No newline at end of file
+if [ "${SERVER_MODE:-gunicorn}" = "dev" ]; then
+    python3 registration-server.py
+else
+    exec gunicorn registration-server:app
+fi
\ No newline at end of file